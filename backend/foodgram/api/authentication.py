@@ -0,0 +1,46 @@
+import copy
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from api.cache import LocalCache, bump_generation, get_generation
+
+USER_GENERATION_KEY = 'auth:user:{}'
+
+
+def user_generation_key(user_id):
+    return USER_GENERATION_KEY.format(user_id)
+
+
+# Изменения из других процессов видны по поколению пользователя в общем кеше.
+snapshots = LocalCache(settings.AUTH_TOKEN_CACHE_SIZE,
+                       settings.AUTH_TOKEN_CACHE_TIMEOUT)
+
+
+def invalidate_user(user_id):
+    bump_generation(user_generation_key(user_id))
+
+
+def restore(user, token):
+    # Каждый запрос получает свои копии, чтобы изменения
+    # не попадали в общий снимок.
+    user = copy.copy(user)
+    token = copy.copy(token)
+    token.user = user
+    return user, token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        snapshot = snapshots.get(key)
+        if snapshot is not None:
+            user, token, generation = snapshot
+            if get_generation(user_generation_key(user.pk)) == generation:
+                return restore(user, token)
+            snapshots.discard(key)
+        user, token = super().authenticate_credentials(key)
+        snapshots.set(key, (
+            *restore(user, token),
+            get_generation(user_generation_key(user.pk)),
+        ))
+        return user, token
@@ -0,0 +1,86 @@
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+BENCHMARK_IMAGE = 'recipes/images/benchmark.png'
+
+
+@contextmanager
+def rolled_back():
+    # Данные замера не переживают команду.
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def measure(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summary(timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return (f'медиана {statistics.median(timings):.2f} мс, '
+            f'p95 {p95:.2f} мс')
+
+
+def unique_prefix():
+    return f'benchmark-{uuid.uuid4().hex[:8]}'
+
+
+def create_users(count, prefix=None):
+    prefix = prefix or unique_prefix()
+    return User.objects.bulk_create(
+        User(email=f'{prefix}-{number}@example.org',
+             username=f'{prefix}-{number}',
+             first_name='Замер', last_name='Замер')
+        for number in range(count)
+    )
+
+
+def create_recipes(author, count, ingredients=10, per_recipe=None, tags=2):
+    # Рецепты создаются пачками, без сигналов: замеру нужны только строки.
+    # Каждый берёт per_recipe ингредиентов подряд по кругу справочника.
+    per_recipe = per_recipe or ingredients
+    prefix = unique_prefix()
+    ingredient_rows = Ingredient.objects.bulk_create(
+        Ingredient(name=f'{prefix}-{number}', measurement_unit='г')
+        for number in range(ingredients)
+    )
+    tag_rows = Tag.objects.bulk_create(
+        Tag(name=f'{prefix}-{number}', slug=f'{prefix}-{number}',
+            color='#E26C2D')
+        for number in range(tags)
+    )
+    recipes = Recipe.objects.bulk_create(
+        Recipe(author=author, name=f'{prefix}-{number}', text='Описание',
+               image=BENCHMARK_IMAGE, cooking_time=10)
+        for number in range(count)
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            recipe=recipe, amount=100,
+            ingredient=ingredient_rows[
+                (number * per_recipe + offset) % ingredients
+            ],
+        )
+        for number, recipe in enumerate(recipes)
+        for offset in range(per_recipe)
+    )
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe=recipe, tag=tag)
+        for recipe in recipes
+        for tag in tag_rows
+    )
+    return recipes
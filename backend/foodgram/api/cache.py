@@ -0,0 +1,147 @@
+import atexit
+import threading
+import time
+from collections import Counter, OrderedDict
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.connection import ConnectionProxy
+from rest_framework.response import Response
+
+GENERATION_KEY = 'recipes:generation'
+HITS_KEY = 'recipes:cache:hits'
+MISSES_KEY = 'recipes:cache:misses'
+
+# Прокси, как и django.core.cache.cache: подмена CACHES в тестах
+# и сброс соединений не оставляют здесь старый бэкенд.
+persistent = ConnectionProxy(caches, 'persistent')
+
+
+class LocalCache:
+    # Ограниченный LRU в памяти процесса, записи живут не дольше timeout.
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.timeout
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def get_generation(key=GENERATION_KEY):
+    generation = persistent.get(key)
+    if generation is None:
+        # Новое значение берётся из времени, чтобы после потери ключа
+        # не вернуться к одному из уже использованных поколений.
+        persistent.add(key, time.time_ns(), timeout=None)
+        generation = persistent.get(key)
+    return generation
+
+
+def get_generations(keys):
+    generations = persistent.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            generations[key] = get_generation(key)
+    return generations
+
+
+def bump_generation(key=GENERATION_KEY):
+    try:
+        persistent.incr(key)
+    except ValueError:
+        get_generation(key)
+
+
+def increment(key, delta=1):
+    try:
+        persistent.incr(key, delta)
+    except ValueError:
+        if not persistent.add(key, delta, timeout=None):
+            persistent.incr(key, delta)
+
+
+class CacheStats:
+    # Попадания копятся в памяти процесса и уходят в общий счётчик
+    # раз в интервал, а не записью на каждый запрос.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = Counter()
+        self.flushed_at = time.monotonic()
+
+    def add(self, key):
+        with self.lock:
+            self.pending[key] += 1
+            due = (time.monotonic() - self.flushed_at
+                   >= settings.CACHE_STATS_FLUSH_INTERVAL)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+            self.flushed_at = time.monotonic()
+        for key, amount in pending.items():
+            increment(key, amount)
+
+
+stats = CacheStats()
+atexit.register(stats.flush)
+
+
+def cache_stats():
+    return {'hits': persistent.get(HITS_KEY, 0),
+            'misses': persistent.get(MISSES_KEY, 0)}
+
+
+def response_cache_key(request, *parts):
+    params = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in sorted(values)
+    )
+    raw = ':'.join((request.scheme, request.get_host(),
+                    *map(str, parts), urlencode(params)))
+    digest = md5(raw.encode()).hexdigest()
+    return f'recipes:response:{get_generation()}:{digest}'
+
+
+def cached_response(request, get_response, *key_parts):
+    key = response_cache_key(request, *key_parts)
+    data = cache.get(key)
+    if data is not None:
+        stats.add(HITS_KEY)
+        return Response(data)
+    stats.add(MISSES_KEY)
+    response = get_response()
+    if response.status_code == 200:
+        cache.set(key, response.data, settings.RECIPES_CACHE_TIMEOUT)
+    return response
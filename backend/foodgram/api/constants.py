@@ -1,3 +1,22 @@
 MIN_INTEGERFIELD_VALUE = 1
 MAX_INTEGERFIELD_VALUE = 32_000
-SHORT_ID_LENGTH = 6
+QUERY_BUDGETS = {
+    'recipes': 6,
+    'recipe': 5,
+    'users': 3,
+    'me': 1,
+    'subscriptions': 4,
+}
+MAX_BULK_RECIPES = 100
+IMAGE_RENDITIONS = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1280,
+}
+RENDITION_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+RENDITIONS_DIR = 'renditions'
+ALLOWED_IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp')
+BASE64_CHUNK_SIZE = 4 * 64 * 1024
@@ -1,11 +1,7 @@
-from rest_framework.filters import SearchFilter
 from django_filters.rest_framework import FilterSet, filters
 
 from recipes.models import Tag, Recipe
-
-
-class IngredientSearchFilter(SearchFilter):
-    search_param = 'name'
+from recipes.search import search_recipes
 
 
 class RecipeFilter(FilterSet):
@@ -20,17 +16,22 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(favorite_recipes__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(shopping_cart__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
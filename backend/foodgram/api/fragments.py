@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from api.cache import bump_generation, get_generations
+from api.renditions import absolute_renditions
+from api.serializers import RecipeFragmentSerializer, RecipeSerializer
+from recipes.models import Recipe
+
+FRAGMENT_KEY = 'recipes:fragment:{}:{}'
+VERSION_KEY = 'recipes:fragment-version:{}'
+
+
+def version_key(recipe_id):
+    return VERSION_KEY.format(recipe_id)
+
+
+def get_fragments(recipe_ids):
+    # Версия читается до загрузки из базы: фрагмент, собранный из строки
+    # до изменения, ляжет под старую версию и читателям уже не попадётся.
+    versions = get_generations([version_key(pk) for pk in recipe_ids])
+    keys = {
+        FRAGMENT_KEY.format(recipe_id, versions[version_key(recipe_id)]):
+            recipe_id
+        for recipe_id in recipe_ids
+    }
+    cached = cache.get_many(keys)
+    fragments = {keys[key]: fragment for key, fragment in cached.items()}
+    missing = {recipe_id: key for key, recipe_id in keys.items()
+               if recipe_id not in fragments}
+    if missing:
+        recipes = Recipe.objects.for_fragments().filter(pk__in=missing)
+        built = {recipe.pk: RecipeFragmentSerializer(recipe).data
+                 for recipe in recipes}
+        cache.set_many(
+            {missing[recipe_id]: fragment
+             for recipe_id, fragment in built.items()},
+            settings.RECIPES_CACHE_TIMEOUT
+        )
+        fragments.update(built)
+    return fragments
+
+
+def invalidate_fragments(recipe_ids):
+    for recipe_id in recipe_ids:
+        bump_generation(version_key(recipe_id))
+
+
+def absolute_url(request, url):
+    return request.build_absolute_uri(url) if url else url
+
+
+def render_recipes(recipes, request):
+    fragments = get_fragments([recipe.pk for recipe in recipes])
+    rendered = []
+    for recipe in recipes:
+        fragment = fragments.get(recipe.pk)
+        if fragment is None:
+            continue
+        author = fragment['author']
+        if author is not None:
+            author = {
+                **author,
+                'avatar': absolute_url(request, author['avatar']),
+                'avatar_renditions': absolute_renditions(
+                    request, author['avatar_renditions']
+                ),
+                'is_subscribed': recipe.author_is_subscribed,
+            }
+        data = {
+            **fragment,
+            'author': author,
+            'image': absolute_url(request, fragment['image']),
+            'image_renditions': absolute_renditions(
+                request, fragment['image_renditions']
+            ),
+            'is_favorited': recipe.is_favorited,
+            'is_in_shopping_cart': recipe.is_in_shopping_cart,
+            'views': recipe.views,
+            'short_link_hits': recipe.short_link_hits,
+        }
+        rendered.append({field: data[field]
+                         for field in RecipeSerializer.Meta.fields})
+    return rendered
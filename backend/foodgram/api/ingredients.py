@@ -0,0 +1,109 @@
+import heapq
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from api.cache import get_generation
+from recipes.models import Ingredient
+
+GENERATION_KEY = 'ingredients:generation'
+PREFIX_BOOST = 1
+WORD_RE = re.compile(r'\w+')
+
+
+def trigrams(text):
+    # Те же триграммы, что строит pg_trgm: слово дополняется двумя
+    # пробелами слева и одним справа.
+    return {
+        padded[position:position + 3]
+        for word in WORD_RE.findall(text.casefold())
+        for padded in (f'  {word} ',)
+        for position in range(len(padded) - 2)
+    }
+
+
+class IngredientIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = None
+        self.data = ([], [], {}, {}, [])
+
+    def load(self):
+        generation = get_generation(GENERATION_KEY)
+        if generation != self.generation:
+            with self.lock:
+                if generation != self.generation:
+                    self.data = self.build()
+                    self.generation = generation
+        return self.data
+
+    def build(self):
+        ingredients = sorted(
+            (name.casefold(), name, measurement_unit, pk)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'pk', 'name', 'measurement_unit'
+            )
+        )
+        keys = [key for key, *_ in ingredients]
+        rows = [{'name': name, 'measurement_unit': measurement_unit, 'id': pk}
+                for _, name, measurement_unit, pk in ingredients]
+        postings = defaultdict(list)
+        sizes = []
+        for position, key in enumerate(keys):
+            key_trigrams = trigrams(key)
+            sizes.append(len(key_trigrams))
+            for trigram in key_trigrams:
+                postings[trigram].append(position)
+        return keys, rows, {row['id']: row for row in rows}, postings, sizes
+
+    def prefix_positions(self, keys, prefix):
+        for position in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[position].startswith(prefix):
+                break
+            yield position
+
+    def search(self, prefix, limit=None):
+        keys, rows, *_ = self.load()
+        if not prefix:
+            return rows
+        prefix = prefix.casefold()
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        found = []
+        for position in self.prefix_positions(keys, prefix):
+            if len(found) == limit:
+                break
+            found.append(rows[position])
+        return found
+
+    def fuzzy_search(self, query, limit=None):
+        keys, rows, _, postings, sizes = self.load()
+        query = query.casefold().strip()
+        query_trigrams = trigrams(query)
+        if not query_trigrams:
+            return self.search(query, limit)
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(postings.get(trigram, ()))
+        scores = {}
+        for position, common in shared.items():
+            similarity = common / (len(query_trigrams) + sizes[position]
+                                   - common)
+            if similarity >= settings.INGREDIENT_FUZZY_THRESHOLD:
+                scores[position] = similarity
+        for position in self.prefix_positions(keys, query):
+            scores[position] = scores.get(position, 0) + PREFIX_BOOST
+        best = heapq.nsmallest(
+            limit, scores, key=lambda position: (-scores[position],
+                                                 keys[position])
+        )
+        return [rows[position] for position in best]
+
+    def get(self, pk):
+        return self.load()[2].get(pk)
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,75 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.benchmarks import create_users, measure, rolled_back, summary
+from jobs.queue import run_pending
+from recipes.models import Recipe, TimelineEntry
+from users.models import Subscription
+
+
+class Command(BaseCommand):
+    help = ('Замерить публикацию рецептов у авторов с большим числом '
+            'подписчиков и чтение ленты')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--followers', type=int, default=12_000)
+        parser.add_argument('--authors', type=int, default=3)
+        parser.add_argument('--recipes', type=int, default=30)
+        parser.add_argument('--repeat', type=int, default=100)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            followers = create_users(options['followers'])
+            authors = create_users(options['authors'])
+            Subscription.objects.bulk_create(
+                Subscription(subscriber=follower, author=author)
+                for author in authors
+                for follower in followers
+            )
+            self.publish(authors, options['recipes'])
+            self.read(followers[0], options['repeat'])
+
+    def publish(self, authors, count):
+        inline = []
+        background = []
+        for number in range(count):
+            started = time.perf_counter()
+            Recipe.objects.create(
+                author=authors[number % len(authors)],
+                name=f'Рецепт {number}', text='Описание', image='',
+                cooking_time=10,
+            )
+            inline.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            while run_pending():
+                pass
+            background.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(
+            f'Публикация, первая пачка подписчиков: {summary(inline)}'
+        )
+        self.stdout.write(f'Раскладка остальных воркером: '
+                          f'{summary(background)}')
+        self.stdout.write(
+            f'Записей в лентах: {TimelineEntry.objects.count()}'
+        )
+
+    def read(self, follower, repeat):
+        client = APIClient(SERVER_NAME=settings.ALLOWED_HOSTS[0])
+        client.force_authenticate(follower)
+        first = client.get('/api/recipes/feed/?limit=10').data
+        for title, url in (('Первая страница ленты',
+                            '/api/recipes/feed/?limit=10'),
+                           ('Следующая страница ленты', first['next'])):
+            with CaptureQueriesContext(connection) as context:
+                client.get(url)
+            # Журнал запросов очищается в начале каждого запроса.
+            queries = len(context.captured_queries)
+            timings = measure(lambda: client.get(url), repeat)
+            self.stdout.write(
+                f'{title}: {summary(timings)}, запросов {queries}'
+            )
@@ -0,0 +1,61 @@
+from itertools import cycle
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from api.benchmarks import (create_recipes, create_users, measure,
+                            rolled_back, summary)
+from api.fragments import invalidate_fragments, render_recipes
+from api.serializers import RecipeSerializer
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Сравнить сборку страницы рецептов сериализатором '
+            'и из кешированных фрагментов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--page-size', type=int, default=12)
+        parser.add_argument('--ingredients', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=100)
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        with rolled_back():
+            user, author = create_users(2)
+            recipes = create_recipes(author, options['recipes'],
+                                     ingredients=options['ingredients'])
+            request = RequestFactory().get(
+                '/api/recipes/', HTTP_HOST=settings.ALLOWED_HOSTS[0]
+            )
+            request.user = user
+            pages = [
+                [recipe.pk for recipe in recipes[start:start + page_size]]
+                for start in range(0, len(recipes), page_size)
+            ]
+            try:
+                self.compare(user, request, pages, options['repeat'])
+            finally:
+                # Номера рецептов после отката могут достаться новым.
+                invalidate_fragments([recipe.pk for recipe in recipes])
+
+    def compare(self, user, request, pages, repeat):
+        def serializer(page):
+            recipes = Recipe.objects.for_read(user).filter(pk__in=page)
+            return RecipeSerializer(recipes, many=True,
+                                    context={'request': request}).data
+
+        def fragments(page):
+            recipes = Recipe.objects.for_listing(user).filter(pk__in=page)
+            return render_recipes(list(recipes), request)
+
+        # Фрагменты прогреваются заранее, как у уже открытых рецептов.
+        for page in pages:
+            fragments(page)
+        for title, build in (('Сериализатор', serializer),
+                             ('Фрагменты', fragments)):
+            queue = cycle(pages)
+            timings = measure(lambda: build(next(queue)), repeat)
+            self.stdout.write(f'{title}: {summary(timings)} на страницу')
@@ -0,0 +1,72 @@
+import random
+from io import StringIO
+from itertools import cycle
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from api.benchmarks import measure, rolled_back, summary
+from api.ingredients import IngredientIndex
+from recipes.models import Ingredient
+
+LETTERS = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+VOWELS = 'аеёиоуыэюя'
+MIN_NAME_LENGTH = 5
+
+
+def make_typo(name, rng):
+    # Одна ошибка на запрос: замена буквы (гласной на гласную),
+    # пропуск буквы или перестановка соседних.
+    letters = [position for position, char in enumerate(name[:-1])
+               if char.isalpha()]
+    position = rng.choice(letters)
+    kind = rng.choice(('replace', 'delete', 'swap'))
+    if kind == 'delete':
+        return name[:position] + name[position + 1:]
+    if kind == 'swap':
+        return (name[:position] + name[position + 1] + name[position]
+                + name[position + 2:])
+    char = name[position].lower()
+    pool = VOWELS if char in VOWELS else LETTERS
+    return (name[:position] + rng.choice(pool.replace(char, ''))
+            + name[position + 1:])
+
+
+class Command(BaseCommand):
+    help = ('Замерить полноту и время нечёткого поиска ингредиентов '
+            'по запросам с опечатками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            if not Ingredient.objects.exists():
+                call_command('load_ingredients', stdout=StringIO())
+            self.run(options['queries'], random.Random(options['seed']))
+
+    def run(self, count, rng):
+        index = IngredientIndex()
+        index.load()
+        ingredients = [row for row in index.search('')
+                       if len(row['name']) >= MIN_NAME_LENGTH]
+        sample = rng.sample(ingredients, min(count, len(ingredients)))
+        queries = [(make_typo(row['name'], rng), row['id'])
+                   for row in sample]
+        top_one = top_ten = 0
+        for query, pk in queries:
+            found = [row['id'] for row in index.fuzzy_search(query, 10)]
+            top_one += found[:1] == [pk]
+            top_ten += pk in found
+        self.stdout.write(
+            f'Справочник: {len(index.search(""))}, запросов: {len(queries)}'
+        )
+        self.stdout.write(f'Полнота: первый результат '
+                          f'{top_one / len(queries):.1%}, первые десять '
+                          f'{top_ten / len(queries):.1%}')
+        for title, search in (('Нечёткий поиск', index.fuzzy_search),
+                              ('Поиск по префиксу', index.search)):
+            queue = cycle(query for query, _ in queries)
+            timings = measure(lambda: search(next(queue), 10), len(queries))
+            self.stdout.write(f'{title}: {summary(timings)}')
@@ -0,0 +1,105 @@
+import shutil
+import tempfile
+from itertools import count
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.benchmarks import create_users, measure, rolled_back, summary
+from api.fragments import invalidate_fragments
+from recipes.models import Ingredient, ShoppingCart, Tag
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAACV'
+    'BMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNoAAAAgg'
+    'CByxOyYQAAAABJRU5ErkJggg=='
+)
+
+
+class Command(BaseCommand):
+    help = ('Замерить создание и изменение рецептов с разным числом '
+            'ингредиентов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[5, 30])
+        parser.add_argument('--carts', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        # Картинки рецептов не должны остаться в настоящем MEDIA_ROOT.
+        # Весь замер идёт в одной транзакции: PostgreSQL не вычищает старые
+        # версии строк списков покупок до её конца, поэтому с числом
+        # повторов изменения заметно дорожают.
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root), rolled_back():
+                self.run(options)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def run(self, options):
+        author, *buyers = create_users(options['carts'] + 1)
+        tag = Tag.objects.create(name='Замер', slug='benchmark-write',
+                                 color='#E26C2D')
+        size = max(options['sizes'])
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Замер {number}', measurement_unit='г')
+            for number in range(size * 2)
+        )
+        client = APIClient(SERVER_NAME=settings.ALLOWED_HOSTS[0])
+        client.force_authenticate(author)
+        created = []
+        try:
+            for size in options['sizes']:
+                self.compare(client, tag, ingredients, size, buyers,
+                             options['repeat'], created)
+        finally:
+            # Номера рецептов после отката могут достаться новым.
+            invalidate_fragments(created)
+
+    def compare(self, client, tag, ingredients, size, buyers, repeat,
+                created):
+        numbers = count()
+
+        def payload(offset):
+            # Соседние составы пересекаются наполовину: часть строк
+            # остаётся, часть меняет количество, остальные заменяются.
+            return {
+                'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+                'image': IMAGE, 'tags': [tag.pk],
+                'ingredients': [
+                    {'id': ingredient.pk, 'amount': 10 + offset}
+                    for ingredient in
+                    ingredients[offset * size // 2:][:size]
+                ],
+            }
+
+        def create():
+            response = client.post('/api/recipes/', payload(0),
+                                   format='json')
+            created.append(response.data['id'])
+            return response
+
+        def update():
+            return client.patch(f'/api/recipes/{recipe_id}/',
+                                payload(next(numbers) % 2 + 1),
+                                format='json')
+
+        # Первая загрузка картинки сохраняет файл, следующие находят его.
+        recipe_id = create().data['id']
+        # Через сигналы, чтобы у покупателей появились списки покупок.
+        for buyer in buyers:
+            ShoppingCart.objects.create(user=buyer, recipe_id=recipe_id)
+        for title, write in (('Создание', create), ('Изменение', update)):
+            with CaptureQueriesContext(connection) as context:
+                write()
+            queries = len(context.captured_queries)
+            timings = measure(write, repeat)
+            self.stdout.write(
+                f'{title}, ингредиентов {size}: {summary(timings)}, '
+                f'запросов {queries}'
+            )
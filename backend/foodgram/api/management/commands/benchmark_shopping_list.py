@@ -0,0 +1,56 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from api import toggles
+from api.benchmarks import create_recipes, create_users, rolled_back
+from api.utils import SHOPPING_LIST_FORMATS, render_pdf, shopping_cart
+
+
+class Command(BaseCommand):
+    help = ('Замерить время и пик памяти выгрузки списка покупок '
+            'для корзин разного размера')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carts', type=int, nargs='+',
+                            default=[100, 300, 1000],
+                            help='Сколько рецептов в корзине')
+        parser.add_argument('--ingredients', type=int, default=2186,
+                            help='Размер справочника ингредиентов')
+        parser.add_argument('--per-recipe', type=int, default=10)
+
+    def handle(self, *args, **options):
+        # Шрифт для PDF регистрируется один раз на процесс, не в замере.
+        render_pdf(iter(())).close()
+        for size in options['carts']:
+            with rolled_back():
+                user, author = create_users(2)
+                recipes = create_recipes(
+                    author, size, ingredients=options['ingredients'],
+                    per_recipe=options['per_recipe']
+                )
+                toggles.shopping_cart.add_many(
+                    user, [recipe.pk for recipe in recipes]
+                )
+                rows = user.shopping_list.count()
+                for export_format in SHOPPING_LIST_FORMATS:
+                    self.report(size, rows, export_format,
+                                *self.export(user, export_format))
+
+    def export(self, user, export_format):
+        tracemalloc.start()
+        started = time.perf_counter()
+        response = shopping_cart(user, export_format)
+        length = sum(len(chunk) for chunk in response.streaming_content)
+        elapsed = (time.perf_counter() - started) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return elapsed, peak, length
+
+    def report(self, size, rows, export_format, elapsed, peak, length):
+        self.stdout.write(
+            f'Рецептов {size}, строк {rows}, {export_format}: '
+            f'{elapsed:.0f} мс, пик памяти {peak / 1024:.0f} КБ, '
+            f'файл {length / 1024:.0f} КБ'
+        )
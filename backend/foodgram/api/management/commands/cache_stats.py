@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import cache_stats
+
+
+class Command(BaseCommand):
+    help = ('Показать попадания и промахи кеша ответов. Процессы '
+            'сбрасывают счётчики раз в CACHE_STATS_FLUSH_INTERVAL секунд')
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0
+        self.stdout.write(
+            f'Попаданий: {stats["hits"]}, промахов: {stats["misses"]}, '
+            f'доля попаданий: {ratio:.1%}'
+        )
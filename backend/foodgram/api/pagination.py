@@ -1,5 +1,29 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+CURSOR_MODE = 'cursor'
 
 
 class ApiPagination(PageNumberPagination):
     page_size_query_param = "limit"
+
+
+class ApiCursorPagination(CursorPagination):
+    page_size_query_param = 'limit'
+
+
+class RecipeCursorPagination(ApiCursorPagination):
+    ordering = ('-published_date', '-id')
+
+
+class FeedCursorPagination(ApiCursorPagination):
+    ordering = ('-published_date', '-recipe_id')
+
+
+class SubscriptionCursorPagination(ApiCursorPagination):
+    ordering = '-id'
+
+
+def is_cursor_mode(request):
+    params = request.query_params
+    return (params.get('pagination') == CURSOR_MODE
+            or ApiCursorPagination.cursor_query_param in params)
@@ -0,0 +1,167 @@
+import os
+from contextlib import suppress
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from api.authentication import invalidate_user
+from api.constants import (IMAGE_RENDITIONS, RENDITION_FORMATS,
+                           RENDITIONS_DIR)
+from jobs.queue import enqueue, task
+from recipes.changes import notify_recipes_changed
+from recipes.models import Recipe
+
+RENDITIONS_TASK = 'renditions'
+
+# Копии лежат рядом с исходником под детерминированными именами
+# и удаляются вместе с ним.
+rendition_storage = FileSystemStorage(allow_overwrite=True)
+
+
+def renditions_field(field):
+    return f'{field}_renditions'
+
+
+def source_name(image):
+    return image.name if image else None
+
+
+def renditions_outdated(instance, field):
+    renditions = getattr(instance, renditions_field(field))
+    return renditions.get('source') != source_name(getattr(instance, field))
+
+
+def schedule_renditions(instance, field):
+    if renditions_outdated(instance, field):
+        model = instance._meta.label_lower
+        enqueue(RENDITIONS_TASK, key=f'{model}:{instance.pk}:{field}',
+                model=model, pk=instance.pk, field=field)
+
+
+def open_image(image_file):
+    with image_file.open('rb'), Image.open(image_file) as image:
+        # Поворот по EXIF, сами метаданные в копии не сохраняются.
+        image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    image.info.clear()
+    return image
+
+
+def flatten(image):
+    if image.mode == 'RGB':
+        return image
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def encode(image, image_format, options):
+    if image_format == 'JPEG':
+        image = flatten(image)
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def rendition_dir(source):
+    return f'{RENDITIONS_DIR}/{source}'
+
+
+def rendition_source(name):
+    path = PurePosixPath(name)
+    if path.parts[0] != RENDITIONS_DIR:
+        return None
+    return str(path.parent.relative_to(RENDITIONS_DIR))
+
+
+def make_renditions(image_file):
+    original = open_image(image_file)
+    directory = rendition_dir(image_file.name)
+    renditions = {'source': image_file.name}
+    for size_name, size in IMAGE_RENDITIONS.items():
+        image = original.copy()
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        rendition = {'width': image.width, 'height': image.height}
+        for format_name, (image_format, options) in RENDITION_FORMATS.items():
+            rendition[format_name] = rendition_storage.save(
+                f'{directory}/{size_name}.{format_name}',
+                encode(image, image_format, options)
+            )
+        renditions[size_name] = rendition
+    return renditions
+
+
+def delete_renditions(source):
+    directory = rendition_dir(source)
+    try:
+        _, files = rendition_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for file_name in files:
+        rendition_storage.delete(f'{directory}/{file_name}')
+    with suppress(OSError):
+        os.rmdir(rendition_storage.path(directory))
+
+
+@task(RENDITIONS_TASK)
+def build_renditions(model, pk, field):
+    model = apps.get_model(model)
+    target = renditions_field(field)
+    instance = model.objects.filter(pk=pk).only(field, target).first()
+    if instance is None or not renditions_outdated(instance, field):
+        return
+    image = getattr(instance, field)
+    # Картинку могли заменить, пока строились копии.
+    if image:
+        renditions = model.objects.filter(
+            **{f'{target}__source': image.name}
+        ).values_list(target, flat=True).first() or make_renditions(image)
+        unchanged = Q(**{field: image.name})
+    else:
+        renditions = {}
+        unchanged = Q(**{f'{field}__isnull': True}) | Q(**{field: ''})
+    updated = model.objects.filter(unchanged, pk=pk).update(
+        **{target: renditions}
+    )
+    if not updated:
+        return
+    if model is Recipe:
+        notify_recipes_changed([pk])
+    else:
+        invalidate_user(pk)
+        notify_recipes_changed(
+            Recipe.objects.filter(author_id=pk).values_list('pk', flat=True)
+        )
+
+
+def rendition_urls(image, renditions, request=None):
+    if not image or renditions.get('source') != image.name:
+        return {}
+    urls = {}
+    for size_name in IMAGE_RENDITIONS:
+        rendition = renditions.get(size_name)
+        if not rendition:
+            continue
+        urls[size_name] = {
+            **rendition,
+            **{name: rendition_storage.url(rendition[name])
+               for name in RENDITION_FORMATS},
+        }
+    return absolute_renditions(request, urls) if request else urls
+
+
+def absolute_renditions(request, urls):
+    return {
+        size_name: {
+            key: (request.build_absolute_uri(value)
+                  if key in RENDITION_FORMATS else value)
+            for key, value in rendition.items()
+        }
+        for size_name, rendition in urls.items()
+    }
@@ -1,26 +1,61 @@
-import base64
+from collections import Counter
 
-from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
-from rest_framework import serializers, status
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from api.constants import MIN_INTEGERFIELD_VALUE, MAX_INTEGERFIELD_VALUE
+from api.constants import (MIN_INTEGERFIELD_VALUE, MAX_INTEGERFIELD_VALUE,
+                           MAX_BULK_RECIPES)
 from users.models import User, Subscription
 from recipes.models import (Recipe, Tag, Ingredient,
                             Favorite, ShoppingCart, RecipeIngredient)
+from api.renditions import renditions_field, rendition_urls
+from api.subscriptions import subscription_resolver
+from api.uploads import check_image, decode_base64
+from recipes.changes import batch_recipe_changes, notify_recipes_changed
+from recipes.shopping_list import (apply_recipe_change, lock_recipes,
+                                   manual_deltas)
+
+
+class RenditionsField(serializers.Field):
+    def __init__(self, image_field, **kwargs):
+        kwargs.setdefault('source', '*')
+        kwargs['read_only'] = True
+        self.image_field = image_field
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return rendition_urls(
+            getattr(instance, self.image_field),
+            getattr(instance, renditions_field(self.image_field)),
+            self.context.get('request')
+        )
+
+
+class UserListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Подписки на всех пользователей страницы читаются одним запросом.
+        users = list(data.all() if hasattr(data, 'all') else data)
+        subscription_resolver(self.context.get('request')).load(
+            user.pk for user in users if not hasattr(user, 'is_subscribed')
+        )
+        return super().to_representation(users)
 
 
 class UserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     avatar = serializers.ImageField(read_only=True)
+    avatar_renditions = RenditionsField('avatar')
 
     class Meta:
         model = User
         fields = ('email', 'username', 'first_name', 'last_name',
-                  'password', 'id', 'avatar', 'is_subscribed')
+                  'password', 'id', 'avatar', 'avatar_renditions',
+                  'is_subscribed')
         extra_kwargs = {'password': {'write_only': True},
                         'is_subscribed': {'read_only': True}}
+        list_serializer_class = UserListSerializer
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
@@ -28,15 +63,16 @@ class UserSerializer(serializers.ModelSerializer):
         if request and request.method == 'POST':
             if request.path.startswith('/api/users/'):
                 data.pop('avatar', None)
+                data.pop('avatar_renditions', None)
                 data.pop('is_subscribed', None)
         return data
 
     def get_is_subscribed(self, obj):
-        request = self.context['request']
-        user = request.user
-        if not user.is_anonymous:
-            return user.author.filter(subscriber=user).exists()
-        return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return subscription_resolver(
+            self.context.get('request')
+        ).is_subscribed(obj.pk)
 
     def create(self, validated_data):
         return User.objects.create_user(**validated_data)
@@ -47,57 +83,30 @@ class SubscriptionSerializer(serializers.ModelSerializer):
     username = serializers.ReadOnlyField(source='author.username')
     first_name = serializers.ReadOnlyField(source='author.first_name')
     last_name = serializers.ReadOnlyField(source='author.last_name')
-    is_subscribed = serializers.SerializerMethodField()
+    is_subscribed = serializers.BooleanField(read_only=True)
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
     id = serializers.ReadOnlyField(source='author.id')
     avatar = serializers.ImageField(source='author.avatar', read_only=True)
+    avatar_renditions = RenditionsField('avatar', source='author')
 
     class Meta:
         model = Subscription
         fields = ('email', 'username', 'first_name',
                   'last_name', 'is_subscribed', 'recipes',
-                  'recipes_count', 'id', 'avatar')
-
-    def get_is_subscribed(self, obj):
-        request = self.context['request']
-        user = request.user
-        if not user.is_anonymous:
-            return user.author.filter(subscriber=user).exists()
-        return False
+                  'recipes_count', 'id', 'avatar', 'avatar_renditions')
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        if limit:
-            limit = int(limit)
-        recipes = obj.author.recipes.all()
-        if limit:
-            recipes = recipes[:limit]
-        return RecipeMiniSerializer(recipes, many=True).data
-
-    def get_recipes_count(self, obj):
-        return obj.author.recipes.all().count()
-
-    def validate(self, data):
-        request = self.context['request']
-        author = self.context['author']
-        user = request.user
-        if user.author.filter(subscriber=user).exists():
-            raise ValidationError(detail='Вы уже подписаны'
-                                         ' на этого пользователя',
-                                  code=status.HTTP_400_BAD_REQUEST)
-        if user == author:
-            raise ValidationError(detail='Невозможно подписаться'
-                                         ' на самого себя',
-                                  code=status.HTTP_400_BAD_REQUEST)
-        return data
+        return RecipeMiniSerializer(obj.author.latest_recipes,
+                                    many=True).data
 
 
 class RecipeMiniSerializer(serializers.ModelSerializer):
+    image_renditions = RenditionsField('image')
+
     class Meta:
         model = Recipe
-        fields = ('name', 'cooking_time', 'image', 'id')
+        fields = ('name', 'cooking_time', 'image', 'image_renditions', 'id')
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -125,8 +134,26 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('name', 'measurement_unit', 'amount', 'id')
 
 
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    def resolve(self, pks):
+        objects = self.queryset.in_bulk(pks)
+        missing = [pk for pk in pks if pk not in objects]
+        return objects, missing
+
+    def does_not_exist(self, pk):
+        return self.error_messages['does_not_exist'].format(pk_value=pk)
+
+
 class AddIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = BulkPrimaryKeyRelatedField(queryset=Ingredient.objects.all())
     amount = serializers.IntegerField(min_value=MIN_INTEGERFIELD_VALUE,
                                       max_value=MAX_INTEGERFIELD_VALUE)
 
@@ -140,13 +167,18 @@ class Base64ImageField(serializers.ImageField):
         if not data:
             raise serializers.ValidationError("Изображение"
                                               " не может быть пустым!")
-        try:
-            format, imgstr = data.split(';base64,')
-        except ValueError:
+        if isinstance(data, UploadedFile):
+            check_image(data.size, data.content_type)
+            return super().to_internal_value(data)
+        marker = ';base64,'
+        position = data.find(marker) if isinstance(data, str) else -1
+        if position == -1:
             raise serializers.ValidationError('Некорректный'
                                               ' формат изображения!')
-        ext = format.split('/')[-1]
-        data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+        content_type = data[:position].removeprefix('data:')
+        ext = content_type.split('/')[-1]
+        data = decode_base64(data, position + len(marker),
+                             'temp.' + ext, content_type)
         return super().to_internal_value(data)
 
 
@@ -155,28 +187,32 @@ class RecipeSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     ingredients = IngredientRecipeSerializer(many=True,
                                              source='recipe_ingredient')
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
-
-    def get_is_favorited(self, obj):
-        request = self.context['request']
-        user = request.user
-        if not user.is_anonymous:
-            return user.favorite_recipes.filter(recipe=obj).exists()
-        return False
-
-    def get_is_in_shopping_cart(self, obj):
-        request = self.context['request']
-        user = request.user
-        if not user.is_anonymous:
-            return user.shopping_cart.filter(recipe=obj).exists()
-        return False
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
+    image_renditions = RenditionsField('image')
+    views = serializers.IntegerField(read_only=True)
+    short_link_hits = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Recipe
         fields = ('author', 'tags', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart', 'name',
-                  'image', 'text', 'cooking_time', 'id')
+                  'image', 'image_renditions', 'text', 'cooking_time',
+                  'views', 'short_link_hits', 'id')
+
+
+class AuthorFragmentSerializer(UserSerializer):
+    class Meta(UserSerializer.Meta):
+        fields = ('email', 'username', 'first_name', 'last_name',
+                  'id', 'avatar', 'avatar_renditions')
+
+
+class RecipeFragmentSerializer(RecipeSerializer):
+    author = AuthorFragmentSerializer(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = ('author', 'tags', 'ingredients', 'name',
+                  'image', 'image_renditions', 'text', 'cooking_time', 'id')
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
@@ -184,57 +220,48 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     ingredients = AddIngredientSerializer(many=True,
                                           write_only=True,
                                           required=True)
-    tags = serializers.PrimaryKeyRelatedField(queryset=Tag.objects.all(),
-                                              many=True)
+    tags = BulkPrimaryKeyRelatedField(queryset=Tag.objects.all(),
+                                      many=True)
     image = Base64ImageField(required=True)
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
     cooking_time = serializers.IntegerField(min_value=MIN_INTEGERFIELD_VALUE,
                                             max_value=MAX_INTEGERFIELD_VALUE)
 
-    def get_is_favorited(self, obj):
-        request = self.context['request']
-        user = request.user
-        if not user.is_anonymous:
-            return user.favorite_recipes.filter(recipe=obj).exists()
-        return False
-
-    def get_is_in_shopping_cart(self, obj):
-        request = self.context['request']
-        user = request.user
-        if not user.is_anonymous:
-            return user.shopping_cart.filter(recipe=obj).exists()
-        return False
-
     def validate_ingredients(self, value):
         if not value:
             raise ValidationError(
                 {'ingredients': 'Нужно выбрать ингредиент!'}
             )
-        ingredients_set = set()
+        id_field = self.fields['ingredients'].child.fields['id']
+        ids = [item['id'] for item in value]
+        ingredients, missing = id_field.resolve(ids)
+        if missing:
+            raise ValidationError([
+                {'id': [id_field.does_not_exist(item['id'])]}
+                if item['id'] in missing else {}
+                for item in value
+            ])
+        if len(set(ids)) != len(ids):
+            raise ValidationError(
+                {'ingredients': 'Ингридиенты повторяются!'}
+            )
         for item in value:
-            ingredient = get_object_or_404(Ingredient, name=item['id'])
-            if ingredient in ingredients_set:
-                raise ValidationError(
-                    {'ingredients', 'Ингридиенты повторяются!'}
-                )
-            ingredients_set.add(ingredient)
+            item['id'] = ingredients[item['id']]
         return value
 
     def validate_tags(self, value):
-        tags = value
-        if not tags:
+        id_field = self.fields['tags'].child_relation
+        tags, missing = id_field.resolve(value)
+        if missing:
+            raise ValidationError([id_field.does_not_exist(missing[0])])
+        if not value:
             raise ValidationError(
                 {'tags': 'Необходимо выбрать тег!'}
             )
-        tag_set = set()
-        for tag in tags:
-            if tag in tag_set:
-                raise ValidationError(
-                    {'tags': 'Теги повторяются!'}
-                )
-            tag_set.add(tag)
-        return value
+        if len(set(value)) != len(value):
+            raise ValidationError(
+                {'tags': 'Теги повторяются!'}
+            )
+        return [tags[pk] for pk in value]
 
     def add_ingredients_and_tags(self, ingredients, tags, model):
         recipe_ingredients = [
@@ -249,13 +276,9 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         model.tags.set(tags)
 
     def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        representation['tags'] = TagSerializer(instance.tags.all(),
-                                               many=True).data
-        representation['ingredients'] = (
-            IngredientRecipeSerializer(instance.recipe_ingredient.all(),
-                                       many=True).data)
-        return representation
+        user = self.context['request'].user
+        recipe = Recipe.objects.for_read(user).get(pk=instance.pk)
+        return RecipeSerializer(recipe, context=self.context).data
 
     def check_empty(self, ingredients, tags):
         if not ingredients:
@@ -272,10 +295,58 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         if user.is_authenticated:
             validated_data['author'] = user
-        recipe = super().create(validated_data)
-        self.add_ingredients_and_tags(ingredients, tags, recipe)
+        with transaction.atomic(), batch_recipe_changes():
+            recipe = super().create(validated_data)
+            self.add_ingredients_and_tags(ingredients, tags, recipe)
         return recipe
 
+    def update_ingredients(self, instance, ingredients):
+        lock_recipes([instance.pk])
+        current = {}
+        to_delete = []
+        for item in instance.recipe_ingredient.all():
+            if item.ingredient_id in current:
+                to_delete.append(item)
+            else:
+                current[item.ingredient_id] = item
+        to_create = []
+        to_update = []
+        deltas = Counter()
+        for ingredient in ingredients:
+            amount = ingredient['amount']
+            item = current.pop(ingredient['id'].pk, None)
+            if item is None:
+                to_create.append(RecipeIngredient(
+                    recipe=instance,
+                    ingredient=ingredient['id'],
+                    amount=amount
+                ))
+                deltas[ingredient['id'].pk] += amount
+            elif item.amount != amount:
+                deltas[item.ingredient_id] += amount - item.amount
+                item.amount = amount
+                to_update.append(item)
+        to_delete.extend(current.values())
+        for item in to_delete:
+            deltas[item.ingredient_id] -= item.amount
+        if to_delete:
+            with manual_deltas():
+                RecipeIngredient.objects.filter(
+                    pk__in=[item.pk for item in to_delete]
+                ).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        apply_recipe_change(instance.pk, deltas)
+        if to_delete or to_update or to_create:
+            notify_recipes_changed([instance.pk])
+
+    def update_tags(self, instance, tags):
+        current = set(instance.tags.values_list('pk', flat=True))
+        if current != {tag.pk for tag in tags}:
+            instance.tags.set(tags)
+
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients', None)
         tags = validated_data.pop('tags', None)
@@ -283,37 +354,47 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         if user.is_authenticated:
             validated_data['author'] = user
-        instance.ingredients.clear()
-        self.add_ingredients_and_tags(ingredients, tags, instance)
-        return super().update(instance, validated_data)
+        with transaction.atomic(), batch_recipe_changes():
+            self.update_ingredients(instance, ingredients)
+            self.update_tags(instance, tags)
+            return super().update(instance, validated_data)
 
     class Meta:
         model = Recipe
         fields = ('ingredients', 'tags', 'image',
-                  'name', 'text', 'cooking_time', 'author', 'id',
-                  'is_favorited', 'is_in_shopping_cart')
+                  'name', 'text', 'cooking_time', 'author', 'id')
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
     name = serializers.ReadOnlyField(source='recipe.name', read_only=True)
     image = serializers.ImageField(source='recipe.image', read_only=True)
+    image_renditions = RenditionsField('image', source='recipe')
     cooking_time = serializers.IntegerField(source='recipe.cooking_time',
                                             read_only=True)
 
     class Meta:
         model = Favorite
-        fields = ('name', 'image', 'cooking_time', 'id')
+        fields = ('name', 'image', 'image_renditions', 'cooking_time', 'id')
 
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
     name = serializers.ReadOnlyField(source='recipe.name', read_only=True)
     image = serializers.ImageField(source='recipe.image', read_only=True)
+    image_renditions = RenditionsField('image', source='recipe')
     cooking_time = serializers.IntegerField(source='recipe.cooking_time',
                                             read_only=True)
 
     class Meta:
         model = ShoppingCart
-        fields = ('name', 'image', 'cooking_time', 'id')
+        fields = ('name', 'image', 'image_renditions', 'cooking_time', 'id')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=MIN_INTEGERFIELD_VALUE),
+        allow_empty=False,
+        max_length=MAX_BULK_RECIPES,
+    )
 
 
 class UserAvatarSerializer(serializers.ModelSerializer):
@@ -0,0 +1,24 @@
+from django.conf import settings
+
+from api.cache import LocalCache, get_generation
+from api.fragments import version_key
+from recipes.short_links import find_recipe_id
+
+# Запись хранит версию фрагмента рецепта. Удаление или правка рецепта
+# в любом процессе меняют версию, и запись перестаёт действовать.
+resolved = LocalCache(settings.SHORT_LINK_CACHE_SIZE,
+                      settings.SHORT_LINK_CACHE_TIMEOUT)
+
+
+def resolve_short_id(short_id):
+    entry = resolved.get(short_id)
+    if entry is not None:
+        recipe_id, version = entry
+        if get_generation(version_key(recipe_id)) == version:
+            return recipe_id
+        resolved.discard(short_id)
+    recipe_id = find_recipe_id(short_id)
+    if recipe_id is not None:
+        resolved.set(short_id,
+                     (recipe_id, get_generation(version_key(recipe_id))))
+    return recipe_id
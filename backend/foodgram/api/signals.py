@@ -0,0 +1,238 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_user
+from api.cache import bump_generation
+from api.fragments import invalidate_fragments
+from api.ingredients import GENERATION_KEY as INGREDIENTS_GENERATION_KEY
+from api.renditions import delete_renditions, schedule_renditions
+from mediafiles.refcounts import file_deleted, track
+from recipes.changes import notify_recipes_changed, recipes_changed
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.search import update_search_index
+from recipes.shopping_list import (apply_cart_change, apply_recipe_change,
+                                   lock_recipes, tracked_by_signals)
+from recipes.short_links import assign_short_id
+from recipes.timeline import backfill, fan_out, trim
+from users.models import Subscription, User
+
+track(Recipe, 'image')
+track(User, 'avatar')
+
+
+@receiver(recipes_changed)
+def flush_recipes(sender, recipe_ids, **kwargs):
+    recipe_ids = list(recipe_ids)
+    bump_generation()
+    invalidate_fragments(recipe_ids)
+    update_search_index(recipe_ids)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    notify_recipes_changed([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, **kwargs):
+    schedule_renditions(instance, 'image')
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    if created:
+        assign_short_id(instance)
+        fan_out(instance)
+
+
+def previous_values(instance, *fields):
+    if instance._state.adding:
+        return None
+    return type(instance).objects.filter(pk=instance.pk).values_list(
+        *fields
+    ).first()
+
+
+# Списки покупок следуют за каждой строкой корзины и состава рецепта,
+# поэтому изменения из админки и shell их тоже не обходят. Удаление рецепта
+# или пользователя доходит сюда каскадом по тем же строкам.
+@receiver(pre_save, sender=ShoppingCart)
+def cart_saving(sender, instance, **kwargs):
+    if not tracked_by_signals():
+        return
+    instance.previous_cart = previous_values(instance, 'user_id', 'recipe_id')
+    recipe_ids = [instance.recipe_id]
+    if instance.previous_cart:
+        recipe_ids.append(instance.previous_cart[1])
+    lock_recipes(recipe_ids, share=True)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def cart_saved(sender, instance, **kwargs):
+    if not tracked_by_signals():
+        return
+    previous = getattr(instance, 'previous_cart', None)
+    if previous == (instance.user_id, instance.recipe_id):
+        return
+    if previous:
+        user_id, recipe_id = previous
+        apply_cart_change(user_id, [recipe_id], -1)
+    apply_cart_change(instance.user_id, [instance.recipe_id], 1)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def cart_deleting(sender, instance, **kwargs):
+    if tracked_by_signals():
+        lock_recipes([instance.recipe_id], share=True)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def cart_deleted(sender, instance, **kwargs):
+    if tracked_by_signals():
+        apply_cart_change(instance.user_id, [instance.recipe_id], -1)
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def recipe_ingredient_saving(sender, instance, **kwargs):
+    if not tracked_by_signals():
+        return
+    lock_recipes([instance.recipe_id])
+    instance.previous_item = previous_values(
+        instance, 'recipe_id', 'ingredient_id', 'amount'
+    )
+    if instance.previous_item:
+        lock_recipes([instance.previous_item[0]])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, **kwargs):
+    if not tracked_by_signals():
+        return
+    deltas = defaultdict(Counter)
+    previous = getattr(instance, 'previous_item', None)
+    if previous:
+        recipe_id, ingredient_id, amount = previous
+        deltas[recipe_id][ingredient_id] -= amount
+    deltas[instance.recipe_id][instance.ingredient_id] += instance.amount
+    for recipe_id, recipe_deltas in deltas.items():
+        apply_recipe_change(recipe_id, recipe_deltas)
+
+
+@receiver(pre_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleting(sender, instance, **kwargs):
+    if not tracked_by_signals():
+        return
+    lock_recipes([instance.recipe_id])
+    # Количество перечитывается под блокировкой рецепта.
+    instance.amount = RecipeIngredient.objects.filter(
+        pk=instance.pk
+    ).values_list('amount', flat=True).first() or 0
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(sender, instance, **kwargs):
+    if tracked_by_signals():
+        apply_recipe_change(instance.recipe_id,
+                            {instance.ingredient_id: -instance.amount})
+
+
+# Ленты подписок тоже следуют за строками подписок, как и публикация
+# рецепта: админка и shell не оставляют их устаревшими.
+@receiver(pre_save, sender=Subscription)
+def subscription_saving(sender, instance, **kwargs):
+    instance.previous_subscription = previous_values(
+        instance, 'subscriber_id', 'author_id'
+    )
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_saved(sender, instance, **kwargs):
+    previous = getattr(instance, 'previous_subscription', None)
+    if previous == (instance.subscriber_id, instance.author_id):
+        return
+    if previous:
+        subscriber_id, author_id = previous
+        trim(subscriber_id, [author_id])
+    backfill(instance.subscriber_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    trim(instance.subscriber_id, [instance.author_id])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    notify_recipes_changed([instance.recipe_id])
+
+
+def related_recipe_ids(instance):
+    if isinstance(instance, Ingredient):
+        return instance.recipe_ingredient.values_list('recipe_id', flat=True)
+    return instance.recipes.values_list('pk', flat=True)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            notify_recipes_changed([instance.pk])
+    elif action == 'pre_clear':
+        notify_recipes_changed(related_recipe_ids(instance))
+    elif action in ('post_add', 'post_remove'):
+        notify_recipes_changed(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def related_changed(sender, instance, **kwargs):
+    notify_recipes_changed(related_recipe_ids(instance))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    transaction.on_commit(
+        lambda: bump_generation(INGREDIENTS_GENERATION_KEY)
+    )
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    notify_recipes_changed(related_recipe_ids(instance))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_saved(sender, instance, **kwargs):
+    # Пароль, аватар или удаление: снимки в кеше аутентификации устаревают.
+    transaction.on_commit(lambda: invalidate_user(instance.pk))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_user(instance.user_id))
+
+
+@receiver(post_save, sender=User)
+def avatar_saved(sender, instance, **kwargs):
+    schedule_renditions(instance, 'avatar')
+
+
+@receiver(file_deleted)
+def source_file_deleted(sender, name, **kwargs):
+    delete_renditions(name)
@@ -0,0 +1,39 @@
+from users.models import Subscription
+
+RESOLVER_ATTR = '_subscription_resolver'
+
+
+class SubscriptionResolver:
+    # Помнит, на кого подписан пользователь, в пределах одного запроса.
+    def __init__(self, user):
+        self.user = user
+        self.known = {}
+
+    def load(self, author_ids):
+        if self.user is None or not self.user.is_authenticated:
+            return
+        missing = set(author_ids) - self.known.keys() - {self.user.pk}
+        if not missing:
+            return
+        subscribed = set(Subscription.objects.filter(
+            subscriber=self.user, author_id__in=missing
+        ).values_list('author_id', flat=True))
+        self.known.update({pk: pk in subscribed for pk in missing})
+
+    def is_subscribed(self, author_id):
+        if self.user is None or not self.user.is_authenticated:
+            return False
+        if author_id == self.user.pk:
+            return False
+        self.load([author_id])
+        return self.known[author_id]
+
+
+def subscription_resolver(request):
+    if request is None:
+        return SubscriptionResolver(None)
+    resolver = getattr(request, RESOLVER_ATTR, None)
+    if resolver is None:
+        resolver = SubscriptionResolver(request.user)
+        setattr(request, RESOLVER_ATTR, resolver)
+    return resolver
@@ -0,0 +1,23 @@
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+from api.constants import QUERY_BUDGETS
+
+
+@contextmanager
+def assert_max_queries(limit, using=DEFAULT_DB_ALIAS):
+    if isinstance(limit, str):
+        limit = QUERY_BUDGETS[limit]
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+    executed = len(context.captured_queries)
+    if executed > limit:
+        queries = '\n'.join(
+            f'{number}. {query["sql"]}'
+            for number, query in enumerate(context.captured_queries, start=1)
+        )
+        raise AssertionError(
+            f'Выполнено {executed} запросов при лимите {limit}:\n{queries}'
+        )
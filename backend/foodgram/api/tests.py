@@ -0,0 +1,1158 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import warnings
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.paginator import UnorderedObjectListWarning
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.test import APIClient
+
+from api.authentication import snapshots
+from api.constants import MAX_BULK_RECIPES
+from api.cache import bump_generation, persistent, stats
+from api.fragments import get_fragments, invalidate_fragments
+from api.ingredients import GENERATION_KEY as INGREDIENTS_GENERATION_KEY
+from api.renditions import RENDITIONS_TASK
+from api.short_links import resolved
+from api.testing import assert_max_queries
+from jobs.models import Job
+from jobs.queue import claim, enqueue, fail, run_pending
+from recipes.counters import counters
+from recipes.management.commands.load_ingredients import read_json
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeStats, ShoppingCart, Tag, TimelineEntry)
+from recipes.constants import SHORT_ID_LENGTH
+from recipes.shopping_list import expected_items, stored_items
+from recipes.short_links import SPACE, decode_short_id, encode_short_id
+from recipes.timeline import FAN_OUT_TASK
+from users.models import Subscription, User
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAACV'
+    'BMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNoAAAAgg'
+    'CByxOyYQAAAABJRU5ErkJggg=='
+)
+
+
+# Тесты чистят кеши, поэтому им нужны свои, а не общие с приложением.
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    },
+    'persistent': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-persistent',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    },
+}
+
+
+def create_user(username):
+    return User.objects.create_user(
+        email=f'{username}@example.org', username=username,
+        first_name=username, last_name=username, password='pass',
+    )
+
+
+def does_not_exist(pk):
+    message = PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+    return str(message).format(pk_value=pk)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ApiTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.author = author = create_user('author')
+        tag = Tag.objects.create(name='Завтрак', slug='breakfast',
+                                 color='#E26C2D')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(3)
+        )
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                image='recipes/images/test.png', cooking_time=10,
+            )
+            recipe.tags.add(tag)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=100)
+                for ingredient in ingredients
+            )
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            else:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        cls.recipe = recipe
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class RecipeListQueriesTest(ApiTestCase):
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.data['results']
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        counts = set()
+        for limit in (2, 6, 12):
+            queries, results = self.count_queries(
+                f'/api/recipes/?limit={limit}'
+            )
+            self.assertEqual(len(results), limit)
+            counts.add(queries)
+        self.assertEqual(len(counts), 1, counts)
+
+    def test_user_flags_are_annotated(self):
+        _, results = self.count_queries('/api/recipes/?limit=12')
+        for recipe in results:
+            self.assertNotEqual(recipe['is_favorited'],
+                                recipe['is_in_shopping_cart'])
+
+
+class QueryBudgetTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Subscription.objects.create(subscriber=cls.user, author=cls.author)
+        for number in range(5):
+            author = create_user(f'follower{number}')
+            Subscription.objects.create(subscriber=cls.user, author=author)
+            Recipe.objects.create(
+                author=author, name=f'Рецепт подписки {number}',
+                text='Описание', image='recipes/images/test.png',
+                cooking_time=5,
+            )
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        # Просмотры пишутся в базу тестов, а не после её удаления.
+        self.addCleanup(counters.flush)
+
+    def assert_budget(self, budget, url):
+        # Считаем худший случай: без кешей ответов, фрагментов и токенов.
+        cache.clear()
+        snapshots.clear()
+        with assert_max_queries(budget):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_recipes(self):
+        self.assert_budget('recipes', '/api/recipes/?limit=12')
+
+    def test_recipe(self):
+        self.assert_budget('recipe', f'/api/recipes/{self.recipe.pk}/')
+
+    def test_users(self):
+        self.assert_budget('users', '/api/users/')
+
+    def test_me(self):
+        self.assert_budget('me', '/api/users/me/')
+
+    def test_subscriptions(self):
+        self.assert_budget('subscriptions',
+                           '/api/users/subscriptions/?recipes_limit=2')
+
+
+class AnonymousCacheTest(ApiTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.addCleanup(counters.flush)
+        self.addCleanup(stats.flush)
+        cache.clear()
+
+    def responses(self):
+        listed = self.client.get('/api/recipes/?limit=12').data['results']
+        detail = self.client.get(f'/api/recipes/{self.recipe.pk}/').data
+        return next(recipe for recipe in listed
+                    if recipe['id'] == self.recipe.pk), detail
+
+    def change(self, apply):
+        self.responses()
+        # Повторное чтение обслуживается кешем целиком.
+        with CaptureQueriesContext(connection) as context:
+            self.responses()
+        self.assertEqual(context.captured_queries, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            apply()
+        return self.responses()
+
+    def test_recipe_save(self):
+        def rename():
+            self.recipe.name = 'Новое название'
+            self.recipe.save()
+
+        for recipe in self.change(rename):
+            self.assertEqual(recipe['name'], 'Новое название')
+
+    def test_recipe_ingredient_change(self):
+        item = self.recipe.recipe_ingredient.first()
+
+        def change_amount():
+            item.amount = 250
+            item.save()
+
+        for recipe in self.change(change_amount):
+            amounts = {ingredient['id']: ingredient['amount']
+                       for ingredient in recipe['ingredients']}
+            self.assertEqual(amounts[item.ingredient_id], 250)
+
+    def test_tags_add_and_remove(self):
+        tag = Tag.objects.create(name='Ужин', slug='dinner', color='#49B64E')
+        for recipe in self.change(lambda: self.recipe.tags.add(tag)):
+            self.assertIn(tag.pk, [tag['id'] for tag in recipe['tags']])
+        for recipe in self.change(lambda: self.recipe.tags.remove(tag)):
+            self.assertNotIn(tag.pk, [tag['id'] for tag in recipe['tags']])
+
+    def test_stats_command(self):
+        stats.flush()
+        persistent.clear()
+        self.client.get('/api/recipes/')
+        self.client.get('/api/recipes/')
+        stats.flush()
+        output = StringIO()
+        call_command('cache_stats', stdout=output)
+        self.assertIn('Попаданий: 1, промахов: 1', output.getvalue())
+
+
+class PaginationTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number in range(7):
+            Subscription.objects.create(
+                subscriber=cls.user, author=create_user(f'writer{number}')
+            )
+
+    def ids(self, data):
+        return [item['id'] for item in data['results']]
+
+    def recipe_ids(self):
+        return list(Recipe.objects.order_by(
+            '-published_date', '-id'
+        ).values_list('pk', flat=True))
+
+    def test_page_number_mode_is_default(self):
+        data = self.client.get('/api/recipes/?limit=5').data
+        self.assertEqual(data['count'], 12)
+        self.assertIn('page=2', data['next'])
+        self.assertEqual(self.ids(data), self.recipe_ids()[:5])
+
+    def test_recipe_cursor_links(self):
+        first = self.client.get(
+            '/api/recipes/?limit=5&pagination=cursor'
+        ).data
+        self.assertNotIn('count', first)
+        self.assertIsNone(first['previous'])
+        self.assertIn('cursor=', first['next'])
+        second = self.client.get(first['next']).data
+        self.assertEqual(self.ids(first) + self.ids(second),
+                         self.recipe_ids()[:10])
+        self.assertEqual(self.ids(self.client.get(second['previous']).data),
+                         self.ids(first))
+
+    def test_recipe_cursor_is_stable_when_recipes_are_added(self):
+        expected = self.recipe_ids()
+        first = self.client.get('/api/recipes/?limit=5&cursor=').data
+        Recipe.objects.create(author=self.author, name='Свежий рецепт',
+                              text='Описание', cooking_time=5,
+                              image='recipes/images/test.png')
+        second = self.client.get(first['next']).data
+        self.assertEqual(self.ids(second), expected[5:10])
+
+    def test_recipe_cursor_keeps_filters(self):
+        first = self.client.get(
+            '/api/recipes/?limit=2&pagination=cursor&is_favorited=1'
+        ).data
+        second = self.client.get(first['next']).data
+        favorites = set(Favorite.objects.filter(
+            user=self.user
+        ).values_list('recipe_id', flat=True))
+        self.assertTrue(set(self.ids(first) + self.ids(second))
+                        <= favorites)
+        self.assertIn('is_favorited=1', first['next'])
+
+    def test_subscription_cursor(self):
+        expected = list(Subscription.objects.filter(
+            subscriber=self.user
+        ).order_by('-id').values_list('author_id', flat=True))
+        data = self.client.get(
+            '/api/users/subscriptions/?limit=3&pagination=cursor'
+        ).data
+        seen = self.ids(data)
+        while data['next']:
+            data = self.client.get(data['next']).data
+            seen += self.ids(data)
+        self.assertEqual(seen, expected)
+
+    def test_page_number_lists_are_ordered(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            for url in ('/api/users/?limit=3',
+                        '/api/users/subscriptions/?limit=3'):
+                first = self.client.get(url).data
+                second = self.client.get(first['next']).data
+                self.assertFalse(set(self.ids(first)) & set(self.ids(second)))
+
+
+class FeedTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        followed = create_user('followed')
+        stranger = create_user('stranger')
+        for author in (cls.author, followed):
+            Subscription.objects.create(subscriber=cls.user, author=author)
+        # Рецепты после подписки попадают в ленту при публикации.
+        for number in range(3):
+            for author in (followed, stranger):
+                Recipe.objects.create(
+                    author=author, name=f'Новый рецепт {number}',
+                    text='Описание', image='recipes/images/test.png',
+                    cooking_time=5,
+                )
+        cls.expected = list(Recipe.objects.filter(
+            author__in=(cls.author, followed)
+        ).order_by('-published_date', '-id').values_list('pk', flat=True))
+
+    def ids(self, data):
+        return [recipe['id'] for recipe in data['results']]
+
+    def test_feed_pages_through_followed_authors(self):
+        data = self.client.get('/api/recipes/feed/?limit=4').data
+        self.assertIsNone(data['previous'])
+        pages = [self.ids(data)]
+        while data['next']:
+            data = self.client.get(data['next']).data
+            pages.append(self.ids(data))
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual(self.ids(self.client.get(data['previous']).data),
+                         pages[-2])
+
+    def test_feed_follows_unsubscribe(self):
+        Subscription.objects.filter(author=self.author).delete()
+        data = self.client.get('/api/recipes/feed/?limit=50').data
+        self.assertEqual(self.ids(data), [
+            pk for pk in self.expected
+            if pk not in set(self.author.recipes.values_list('pk', flat=True))
+        ])
+
+    def test_feed_needs_authentication(self):
+        self.assertEqual(APIClient().get('/api/recipes/feed/').status_code,
+                         401)
+
+
+class SearchTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = create_user('cook')
+        self.dinner = Tag.objects.create(name='Ужин', slug='dinner',
+                                         color='#49B64E')
+        self.salt = Ingredient.objects.create(name='Соль',
+                                              measurement_unit='г')
+        beet = Ingredient.objects.create(name='Свекла', measurement_unit='г')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borsch = self.create('Борщ красный', 'Свекла и капуста',
+                                      beet, self.dinner)
+            self.salad = self.create('Салат', 'Подать к борщу',
+                                     self.salt, self.dinner)
+            self.soup = self.create('Суп', 'Вода', self.salt,
+                                    Tag.objects.get(slug='breakfast'),
+                                    author=self.other)
+
+    def create(self, name, text, ingredient, tag, author=None):
+        recipe = Recipe.objects.create(
+            author=author or self.author, name=name, text=text,
+            image='recipes/images/test.png', cooking_time=5,
+        )
+        recipe.tags.add(tag)
+        RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient,
+                                        amount=10)
+        return recipe
+
+    def search(self, **params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_name_ranks_above_text(self):
+        self.assertEqual(self.search(search='борщ'),
+                         [self.borsch.pk, self.salad.pk])
+
+    def test_search_by_ingredient(self):
+        self.assertEqual(self.search(search='соль'),
+                         [self.soup.pk, self.salad.pk])
+
+    def test_search_with_filters(self):
+        self.assertEqual(self.search(search='соль', tags='dinner'),
+                         [self.salad.pk])
+        self.assertEqual(self.search(search='соль', author=self.other.pk),
+                         [self.soup.pk])
+        Favorite.objects.create(user=self.user, recipe=self.salad)
+        self.assertEqual(self.search(search='соль', is_favorited=1),
+                         [self.salad.pk])
+
+    def test_index_follows_renames(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.salt.name = 'Перец'
+            self.salt.save()
+        self.assertEqual(self.search(search='соль'), [])
+        self.assertEqual(self.search(search='перец'),
+                         [self.soup.pk, self.salad.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.soup.name = 'Уха'
+            self.soup.save()
+        self.assertEqual(self.search(search='уха'), [self.soup.pk])
+        self.assertEqual(self.search(search='суп'), [])
+
+    def test_query_syntax_is_not_an_error(self):
+        self.assertEqual(self.search(search='"'), [])
+
+
+class IngredientIndexTest(ApiTestCase):
+    NAMES = ('Молоко топлёное', 'мука', 'Молоко', 'Мёд', 'Помидоры',
+             'Помидоры черри', 'Перец')
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г') for name in cls.NAMES
+        )
+
+    def setUp(self):
+        super().setUp()
+        # Индекс общий на процесс: данные прошлых тестов откатились.
+        bump_generation(INGREDIENTS_GENERATION_KEY)
+
+    def names(self, name, fuzzy=False):
+        params = {'name': name, **({'fuzzy': 1} if fuzzy else {})}
+        response = self.client.get('/api/ingredients/', params)
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def change(self, apply):
+        with self.captureOnCommitCallbacks(execute=True):
+            apply()
+
+    def test_prefix_order(self):
+        self.assertEqual(self.names('мол'), ['Молоко', 'Молоко топлёное'])
+        self.assertEqual(self.names('МУ'), ['мука'])
+        self.assertEqual(self.names('сахар'), [])
+
+    def test_empty_query_returns_everything_sorted(self):
+        names = self.names('')
+        self.assertEqual(len(names), Ingredient.objects.count())
+        self.assertEqual(names, sorted(names, key=str.casefold))
+
+    @override_settings(INGREDIENT_SEARCH_LIMIT=1)
+    def test_limit(self):
+        self.assertEqual(self.names('пом'), ['Помидоры'])
+
+    def test_rebuilt_after_add_and_rename(self):
+        self.names('мол')
+        self.change(lambda: Ingredient.objects.create(
+            name='Молоко козье', measurement_unit='мл'
+        ))
+        self.assertEqual(self.names('мол'),
+                         ['Молоко', 'Молоко козье', 'Молоко топлёное'])
+        flour = Ingredient.objects.get(name='мука')
+        flour.name = 'Мускат'
+        self.change(flour.save)
+        self.assertEqual(self.names('му'), ['Мускат'])
+
+    def test_fuzzy_matches_typos(self):
+        self.assertEqual(self.names('памидор', fuzzy=True)[0], 'Помидоры')
+        self.assertEqual(self.names('малоко', fuzzy=True)[0], 'Молоко')
+        self.assertEqual(self.names('qwerty', fuzzy=True), [])
+
+    def test_fuzzy_boosts_prefix_matches(self):
+        self.assertEqual(self.names('пом', fuzzy=True)[:2],
+                         ['Помидоры', 'Помидоры черри'])
+        self.assertEqual(self.names('помидоры', fuzzy=True)[:2],
+                         ['Помидоры', 'Помидоры черри'])
+
+    def test_retrieve(self):
+        honey = Ingredient.objects.get(name='Мёд')
+        response = self.client.get(f'/api/ingredients/{honey.pk}/')
+        self.assertEqual(response.data, {
+            'name': 'Мёд', 'measurement_unit': 'г', 'id': honey.pk
+        })
+        self.assertEqual(self.client.get('/api/ingredients/0/').status_code,
+                         404)
+
+
+class TokenSnapshotTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        snapshots.clear()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.me().status_code, 200)
+        self.assertIsNotNone(snapshots.get(self.token.key))
+
+    def me(self):
+        return self.client.get('/api/users/me/')
+
+    def request(self, method, url, data=None):
+        # Снимки сбрасываются после коммита, как в настоящем запросе.
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(url, data, format='json')
+
+    def test_logout(self):
+        response = self.request('post', '/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_password_change(self):
+        response = self.request('post', '/api/users/set_password/', {
+            'current_password': 'pass', 'new_password': 'Nov0e-parol',
+        })
+        self.assertEqual(response.status_code, 204)
+        # Следующие запросы проверяют пароль по свежему снимку.
+        response = self.request('post', '/api/users/set_password/', {
+            'current_password': 'pass', 'new_password': 'Drug0y-parol',
+        })
+        self.assertEqual(response.status_code, 400)
+        response = self.request('post', '/api/users/set_password/', {
+            'current_password': 'Nov0e-parol', 'new_password': 'Drug0y-parol',
+        })
+        self.assertEqual(response.status_code, 204)
+
+    def test_deactivation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_deletion(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).delete()
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_avatar_change(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            response = self.request('put', '/api/users/me/avatar/',
+                                    {'avatar': IMAGE})
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNotNone(self.me().data['avatar'])
+            response = self.request('delete', '/api/users/me/avatar/')
+            self.assertEqual(response.status_code, 204)
+            self.assertIsNone(self.me().data['avatar'])
+
+
+class FragmentCacheTest(ApiTestCase):
+    def test_fragment_built_before_change_is_not_served(self):
+        recipe_id = self.recipe.pk
+        stale = list(Recipe.objects.for_fragments().filter(pk=recipe_id))
+
+        def load_then_change():
+            # Рецепт меняется, пока фрагмент собирается из старой строки.
+            Recipe.objects.filter(pk=recipe_id).update(name='Новое название')
+            invalidate_fragments([recipe_id])
+            return mock.Mock(filter=mock.Mock(return_value=stale))
+
+        cache.clear()
+        with mock.patch.object(Recipe.objects, 'for_fragments',
+                               side_effect=load_then_change):
+            self.assertEqual(get_fragments([recipe_id])[recipe_id]['name'],
+                             stale[0].name)
+        self.assertEqual(get_fragments([recipe_id])[recipe_id]['name'],
+                         'Новое название')
+
+    def test_recipe_deleted_while_rendering(self):
+        for_fragments = Recipe.objects.for_fragments
+
+        def delete_then_load():
+            Recipe.objects.filter(pk=self.recipe.pk).delete()
+            return for_fragments()
+
+        cache.clear()
+        with mock.patch.object(Recipe.objects, 'for_fragments',
+                               side_effect=delete_then_load):
+            response = self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 404)
+
+
+class ShoppingListSignalsTest(ApiTestCase):
+    def assert_in_sync(self):
+        self.assertEqual(list(stored_items()), list(expected_items()))
+
+    def test_orm_changes_keep_shopping_lists_in_sync(self):
+        # Так меняют данные админка и shell, минуя API.
+        self.assert_in_sync()
+        other = create_user('buyer')
+        cart = ShoppingCart.objects.create(user=other, recipe=self.recipe)
+        self.assert_in_sync()
+        item = self.recipe.recipe_ingredient.first()
+        item.amount = 250
+        item.save()
+        self.assert_in_sync()
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, amount=7,
+            ingredient=Ingredient.objects.create(name='Соль',
+                                                 measurement_unit='г'),
+        )
+        self.assert_in_sync()
+        item.delete()
+        self.assert_in_sync()
+        cart.recipe = Recipe.objects.exclude(pk=self.recipe.pk).first()
+        cart.save()
+        self.assert_in_sync()
+        ShoppingCart.objects.filter(user=self.user).delete()
+        self.assert_in_sync()
+        self.recipe.delete()
+        self.assert_in_sync()
+        other.delete()
+        self.assert_in_sync()
+
+
+class ShoppingListExportTest(ApiTestCase):
+    ROWS = [(f'Ингредиент {number}', 600, 'г') for number in range(3)]
+
+    def download(self, export_format, content_type, filename):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/',
+            {'format': export_format} if export_format else {}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], content_type)
+        self.assertEqual(response['Content-Disposition'],
+                         f'attachment; filename={filename}')
+        return b''.join(response.streaming_content)
+
+    def test_txt(self):
+        text = self.download(None, 'text/plain; charset=utf-8',
+                             'shopping_list.txt').decode()
+        title, blank, *lines = text.splitlines()
+        self.assertTrue(title.startswith('Список покупок на: '))
+        self.assertEqual(lines, [f'{name} - {amount} {unit}'
+                                 for name, amount, unit in self.ROWS])
+
+    def test_csv(self):
+        text = self.download('csv', 'text/csv; charset=utf-8',
+                             'shopping_list.csv').decode()
+        header, *rows = csv.reader(text.splitlines())
+        self.assertEqual(header, ['name', 'amount', 'measurement_unit'])
+        self.assertEqual(rows, [[name, str(amount), unit]
+                                for name, amount, unit in self.ROWS])
+
+    def test_json(self):
+        data = json.loads(self.download('json', 'application/json',
+                                        'shopping_list.json'))
+        self.assertEqual(data, [
+            {'name': name, 'amount': amount, 'measurement_unit': unit}
+            for name, amount, unit in self.ROWS
+        ])
+
+    def test_pdf(self):
+        content = self.download('pdf', 'application/pdf',
+                                '"shopping_list.pdf"')
+        self.assertTrue(content.startswith(b'%PDF'))
+
+    def test_empty_cart(self):
+        ShoppingCart.objects.filter(user=self.user).delete()
+        self.assertEqual(self.download('json', 'application/json',
+                                       'shopping_list.json'), b'[]')
+
+    def test_unknown_format(self):
+        response = self.client.get('/api/recipes/download_shopping_cart/',
+                                   {'format': 'xls'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {
+            'format': 'Доступные форматы: txt, csv, json, pdf'
+        })
+
+
+class ToggleTest(ApiTestCase):
+    ENDPOINTS = (
+        ('favorite', Favorite, 'Рецепт не существует в избранном'),
+        ('shopping_cart', ShoppingCart,
+         'Рецепт не существует в списке покупок'),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.fresh = Recipe.objects.create(
+            author=cls.author, name='Новый рецепт', text='Описание',
+            image='recipes/images/test.png', cooking_time=5,
+        )
+        RecipeIngredient.objects.create(
+            recipe=cls.fresh, amount=30,
+            ingredient=Ingredient.objects.first(),
+        )
+
+    def assert_in_sync(self):
+        self.assertEqual(list(stored_items()), list(expected_items()))
+
+    def test_add_and_remove(self):
+        for endpoint, model, missing in self.ENDPOINTS:
+            with self.subTest(endpoint):
+                url = f'/api/recipes/{self.fresh.pk}/{endpoint}/'
+                response = self.client.post(url)
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(response.data['name'], self.fresh.name)
+                self.assertTrue(model.objects.filter(
+                    user=self.user, recipe=self.fresh
+                ).exists())
+                self.assert_in_sync()
+                response = self.client.post(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data,
+                                 {'errors': 'Рецепт уже добавлен!'})
+                self.assertEqual(self.client.delete(url).status_code, 204)
+                self.assert_in_sync()
+                response = self.client.delete(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data, {'errors': missing})
+
+    def test_unknown_recipe_and_anonymous(self):
+        for endpoint, _, _ in self.ENDPOINTS:
+            with self.subTest(endpoint):
+                self.assertEqual(
+                    self.client.post(f'/api/recipes/0/{endpoint}/')
+                    .status_code, 404
+                )
+                self.assertEqual(
+                    APIClient().post(
+                        f'/api/recipes/{self.fresh.pk}/{endpoint}/'
+                    ).status_code, 401
+                )
+
+    def test_bulk_results_per_id(self):
+        for endpoint, model, _ in self.ENDPOINTS:
+            with self.subTest(endpoint):
+                present = model.objects.filter(user=self.user).values_list(
+                    'recipe_id', flat=True
+                ).first()
+                recipes = [self.fresh.pk, present, 10 ** 9, self.fresh.pk]
+                url = f'/api/recipes/{endpoint}/'
+                response = self.client.post(url, {'recipes': recipes},
+                                            format='json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data, [
+                    {'id': self.fresh.pk, 'status': 'added'},
+                    {'id': present, 'status': 'exists'},
+                    {'id': 10 ** 9, 'status': 'not_found'},
+                ])
+                self.assert_in_sync()
+                absent = [self.fresh.pk, present]
+                self.client.delete(url, {'recipes': [present]},
+                                   format='json')
+                response = self.client.delete(url, {'recipes': absent},
+                                              format='json')
+                self.assertEqual(response.data, [
+                    {'id': self.fresh.pk, 'status': 'removed'},
+                    {'id': present, 'status': 'absent'},
+                ])
+                self.assert_in_sync()
+
+    def test_bulk_validation(self):
+        for payload in ({'recipes': []},
+                        {'recipes': list(range(1, MAX_BULK_RECIPES + 2))},
+                        {'recipes': [0]}):
+            with self.subTest(payload=payload):
+                response = self.client.post('/api/recipes/favorite/',
+                                            payload, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('recipes', response.data)
+
+
+class SubscribeTest(ApiTestCase):
+    def url(self, user):
+        return f'/api/users/{user.pk}/subscribe/'
+
+    def test_subscribe_and_unsubscribe(self):
+        response = self.client.post(self.url(self.author)
+                                    + '?recipes_limit=2')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['id'], self.author.pk)
+        self.assertTrue(response.data['is_subscribed'])
+        self.assertEqual(response.data['recipes_count'], 12)
+        self.assertEqual(len(response.data['recipes']), 2)
+        response = self.client.post(self.url(self.author))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {
+            'errors': 'Вы уже подписаны на этого пользователя'
+        })
+        self.assertEqual(Subscription.objects.filter(
+            subscriber=self.user, author=self.author
+        ).count(), 1)
+        self.assertEqual(self.client.delete(self.url(self.author))
+                         .status_code, 204)
+        response = self.client.delete(self.url(self.author))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'errors': 'Подписка не существует'})
+
+    def test_subscribe_to_yourself(self):
+        response = self.client.post(self.url(self.user))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {
+            'errors': 'Невозможно подписаться на самого себя'
+        })
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_invalid_recipes_limit(self):
+        response = self.client.post(self.url(self.author)
+                                    + '?recipes_limit=-1')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_unknown_user_and_anonymous(self):
+        self.assertEqual(self.client.post('/api/users/0/subscribe/')
+                         .status_code, 404)
+        self.assertEqual(APIClient().post(self.url(self.author))
+                         .status_code, 401)
+
+
+class RecipeWriteTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.tag = Tag.objects.get()
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Продукт {number}', measurement_unit='шт')
+            for number in range(30)
+        )
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_authenticate(self.author)
+
+    def create(self, ingredients, tags=None):
+        return self.client.post('/api/recipes/', {
+            'name': 'Новый рецепт', 'text': 'Описание', 'cooking_time': 15,
+            'image': IMAGE,
+            'tags': [self.tag.pk] if tags is None else tags,
+            'ingredients': ingredients,
+        }, format='json')
+
+    def ingredient_rows(self, count):
+        return [{'id': ingredient.pk, 'amount': 10}
+                for ingredient in self.ingredients[:count]]
+
+    def test_create_query_count_does_not_depend_on_ingredients(self):
+        # Первая загрузка картинки сохраняет файл, следующие находят его.
+        self.create(self.ingredient_rows(1))
+        counts = []
+        for size in (5, 30):
+            with CaptureQueriesContext(connection) as context:
+                response = self.create(self.ingredient_rows(size))
+            self.assertEqual(response.status_code, 201, response.data)
+            self.assertEqual(len(response.data['ingredients']), size)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_update_keeps_shopping_lists_in_sync(self):
+        response = self.create(self.ingredient_rows(5))
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        buyer = create_user('buyer')
+        for user in (self.user, buyer):
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+        # Первый остаётся, второй меняет количество, остальные уходят,
+        # и добавляются новые.
+        first, second, *_ = self.ingredients
+        response = self.client.patch(f'/api/recipes/{recipe.pk}/', {
+            'name': 'Новый рецепт', 'text': 'Описание', 'cooking_time': 15,
+            'tags': [self.tag.pk],
+            'ingredients': [
+                {'id': first.pk, 'amount': 10},
+                {'id': second.pk, 'amount': 25},
+                *[{'id': ingredient.pk, 'amount': 3}
+                  for ingredient in self.ingredients[5:8]],
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(list(stored_items()), list(expected_items()))
+        self.assertEqual(
+            dict(buyer.shopping_list.values_list('ingredient', 'amount')),
+            {first.pk: 10, second.pk: 25,
+             **{ingredient.pk: 3 for ingredient in self.ingredients[5:8]}}
+        )
+
+    def test_unknown_ingredient(self):
+        response = self.create(
+            [*self.ingredient_rows(1), {'id': 0, 'amount': 10}]
+        )
+        self.assertEqual(response.status_code, 400)
+        first, second = response.data['ingredients']
+        self.assertEqual(first, {})
+        self.assertEqual(second, {'id': [does_not_exist(0)]})
+
+    def test_duplicate_ingredient(self):
+        rows = self.ingredient_rows(1)
+        response = self.create(rows + rows)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'ingredients': {
+            'ingredients': 'Ингридиенты повторяются!'
+        }})
+
+    def test_empty_ingredients(self):
+        response = self.create([])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'ingredients': {
+            'ingredients': 'Нужно выбрать ингредиент!'
+        }})
+
+    def test_unknown_tag(self):
+        response = self.create(self.ingredient_rows(1), tags=[0])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'tags': [does_not_exist(0)]})
+
+    def test_duplicate_tag(self):
+        response = self.create(self.ingredient_rows(1),
+                               tags=[self.tag.pk, self.tag.pk])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data,
+                         {'tags': {'tags': 'Теги повторяются!'}})
+
+    def test_empty_tags(self):
+        response = self.create(self.ingredient_rows(1), tags=[])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data,
+                         {'tags': {'tags': 'Необходимо выбрать тег!'}})
+
+
+class TimelineSignalsTest(ApiTestCase):
+    def feed(self, user):
+        return set(TimelineEntry.objects.filter(
+            subscriber=user
+        ).values_list('author_id', flat=True))
+
+    def test_orm_subscriptions_keep_timeline_in_sync(self):
+        other = create_user('other_author')
+        Recipe.objects.create(author=other, name='Рецепт', text='Описание',
+                              image='recipes/images/test.png',
+                              cooking_time=5)
+        subscription = Subscription.objects.create(subscriber=self.user,
+                                                   author=self.author)
+        self.assertEqual(self.feed(self.user), {self.author.pk})
+        subscription.author = other
+        subscription.save()
+        self.assertEqual(self.feed(self.user), {other.pk})
+        subscription.delete()
+        self.assertEqual(self.feed(self.user), set())
+
+    @override_settings(FEED_BACKFILL_SIZE=5)
+    def test_subscribe_backfills_newest_recipes(self):
+        response = self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(subscriber=self.user).order_by(
+                '-published_date', '-recipe_id'
+            ).values_list('recipe_id', flat=True)),
+            list(self.author.recipes.order_by(
+                '-published_date', '-id'
+            ).values_list('pk', flat=True)[:5])
+        )
+
+    def test_unsubscribe_trims_only_that_author(self):
+        other = create_user('other_author')
+        recipe = Recipe.objects.create(author=other, name='Рецепт',
+                                       text='Описание', cooking_time=5,
+                                       image='recipes/images/test.png')
+        follower = create_user('follower')
+        for subscriber in (self.user, follower):
+            for author in (self.author, other):
+                Subscription.objects.create(subscriber=subscriber,
+                                            author=author)
+        response = self.client.delete(
+            f'/api/users/{self.author.pk}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(list(TimelineEntry.objects.filter(
+            subscriber=self.user
+        ).values_list('recipe_id', flat=True)), [recipe.pk])
+        self.assertEqual(self.feed(follower), {self.author.pk, other.pk})
+
+    @override_settings(FEED_FAN_OUT_BATCH_SIZE=3)
+    def test_fan_out_to_many_followers_continues_in_background(self):
+        followers = [create_user(f'fan{number}') for number in range(8)]
+        for follower in followers:
+            Subscription.objects.create(subscriber=follower,
+                                        author=self.author)
+        recipe = Recipe.objects.create(author=self.author, name='Рецепт',
+                                       text='Описание', cooking_time=5,
+                                       image='recipes/images/test.png')
+        entries = TimelineEntry.objects.filter(recipe=recipe)
+        self.assertEqual(entries.count(), 3)
+        Job.objects.exclude(name=FAN_OUT_TASK).delete()
+        run_pending()
+        self.assertEqual(set(entries.values_list('subscriber_id', flat=True)),
+                         {follower.pk for follower in followers})
+
+
+class ShortLinkTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        resolved.clear()
+        self.addCleanup(counters.flush)
+        self.short_id = Recipe.objects.get(pk=self.recipe.pk).short_id
+
+    def follow(self, short_id):
+        return APIClient().get(f'/s/{short_id}/')
+
+    def test_encode_decode_round_trip(self):
+        for pk in (*range(1, 2000), SPACE - 1, SPACE, SPACE * 5 + 17,
+                   10 ** 15):
+            short_id = encode_short_id(pk)
+            self.assertGreaterEqual(len(short_id), SHORT_ID_LENGTH)
+            self.assertEqual(decode_short_id(short_id), pk)
+        self.assertEqual(
+            len({encode_short_id(pk) for pk in range(1, 2000)}), 1999
+        )
+
+    def test_decode_rejects_malformed_ids(self):
+        self.assertIsNone(decode_short_id('abc'))
+        self.assertIsNone(decode_short_id('abc-def!'))
+
+    def test_unknown_short_id(self):
+        unknown = encode_short_id(Recipe.objects.order_by('pk').last().pk + 1)
+        for short_id in (unknown, 'abc', 'zzzzzzzzz'):
+            self.assertEqual(self.follow(short_id).status_code, 404)
+
+    def test_deleted_recipe_is_not_redirected(self):
+        self.assertEqual(self.follow(self.short_id).status_code, 302)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assertEqual(self.follow(self.short_id).status_code, 404)
+
+    def test_every_click_reaches_the_counter(self):
+        for _ in range(2):
+            response = self.follow(self.short_id)
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(response['Location'],
+                             f'/recipes/{self.recipe.pk}')
+            self.assertIn('no-store', response['Cache-Control'])
+        counters.flush()
+        self.assertEqual(
+            RecipeStats.objects.get(recipe=self.recipe).short_link_hits, 2
+        )
+
+
+class RenditionJobsTest(ApiTestCase):
+    def pending(self):
+        return Job.objects.filter(
+            name=RENDITIONS_TASK, status=Job.Status.PENDING,
+            payload__model='recipes.recipe', payload__pk=self.recipe.pk,
+        )
+
+    def test_repeated_saves_queue_one_job(self):
+        for _ in range(3):
+            self.recipe.save()
+        self.assertEqual(self.pending().count(), 1)
+
+    def test_failed_job_yields_to_a_newer_duplicate(self):
+        Job.objects.exclude(pk__in=self.pending()).delete()
+        job, = claim(1)
+        self.recipe.save()
+        fail(job, 'Ошибка')
+        self.assertFalse(Job.objects.filter(pk=job.pk).exists())
+        self.assertEqual(self.pending().count(), 1)
+
+    def test_jobs_without_key_are_not_merged(self):
+        for _ in range(2):
+            enqueue('noop', value=1)
+        self.assertEqual(Job.objects.filter(name='noop').count(), 2)
+
+
+class LoadIngredientsTest(ApiTestCase):
+    def write(self, name, content):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def load(self, path):
+        output = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('load_ingredients', path, stdout=output)
+        return output.getvalue().strip()
+
+    def test_csv_counts_and_rerun(self):
+        path = self.write('ingredients.csv', (
+            'Соль,г\nСахар,г\nСоль,г\nИнгредиент 0,г\n,г\nПерец\n'
+        ))
+        self.assertEqual(self.load(path),
+                         'Добавлено: 2, уже были: 2, с ошибками: 2')
+        count = Ingredient.objects.count()
+        self.assertEqual(self.load(path),
+                         'Добавлено: 0, уже были: 4, с ошибками: 2')
+        self.assertEqual(Ingredient.objects.count(), count)
+
+    def test_json_counts_and_rerun(self):
+        path = self.write('ingredients.json', json.dumps([
+            {'name': 'Соль', 'measurement_unit': 'г'},
+            {'name': 'Ингредиент 1', 'measurement_unit': 'г'},
+            {'name': 'Соль', 'measurement_unit': 'г'},
+            {'name': 'Перец'},
+            ['Сахар', 'г'],
+        ], ensure_ascii=False))
+        self.assertEqual(self.load(path),
+                         'Добавлено: 2, уже были: 2, с ошибками: 1')
+        self.assertEqual(self.load(path),
+                         'Добавлено: 0, уже были: 4, с ошибками: 1')
+
+    def test_json_chunk_boundaries(self):
+        items = [
+            {'name': f'Продукт {number}', 'measurement_unit': 'г'}
+            for number in range(20)
+        ]
+        # Элемент длиннее нескольких блоков собирается по частям.
+        items.insert(10, {'name': 'x' * 500, 'measurement_unit': 'г'})
+        text = ' \n[ ' + ' ,\n '.join(
+            json.dumps(item, ensure_ascii=False) for item in items
+        ) + ' ]\n'
+        for size in (1, 7, 64, 1024):
+            with self.subTest(size=size), mock.patch(
+                'recipes.management.commands.load_ingredients.READ_SIZE',
+                size
+            ):
+                self.assertEqual(list(read_json(StringIO(text))), items)
+
+    def test_truncated_json(self):
+        text = json.dumps([{'name': 'Соль', 'measurement_unit': 'г'}] * 3)
+        for broken in (text[:-1], text[:-10], text + ' {}', '{}'):
+            with self.subTest(broken=broken):
+                path = self.write('ingredients.json', broken)
+                with self.assertRaises(CommandError):
+                    self.load(path)
+        path = self.write('ingredients.json', text[:-10])
+        with self.assertRaisesMessage(CommandError,
+                                      'Файл JSON повреждён или обрезан!'):
+            self.load(path)
+        self.assertFalse(Ingredient.objects.filter(name='Соль').exists())
@@ -0,0 +1,102 @@
+from django.db import connection, transaction
+
+from recipes.models import Favorite, ShoppingCart
+from recipes.shopping_list import apply_cart_change, lock_recipes
+from recipes.timeline import backfill, trim
+from users.models import Subscription
+
+
+class Toggle:
+    def __init__(self, model, owner_field, target_field):
+        self.model = model
+        self.owner_field = owner_field
+        self.target_field = target_field
+
+    def sql_names(self):
+        meta = self.model._meta
+        quote = connection.ops.quote_name
+        return (quote(meta.db_table),
+                quote(meta.get_field(self.owner_field).column),
+                quote(meta.get_field(self.target_field).column),
+                quote(meta.pk.column))
+
+    def insert(self, owner_id, target_ids):
+        table, owner_column, target_column, pk = self.sql_names()
+        values = ', '.join(['(%s, %s)'] * len(target_ids))
+        params = [value for target_id in target_ids
+                  for value in (owner_id, target_id)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({owner_column}, {target_column}) '
+                f'VALUES {values} '
+                f'ON CONFLICT ({owner_column}, {target_column}) DO NOTHING '
+                f'RETURNING {pk}, {target_column}',
+                params
+            )
+            return cursor.fetchall()
+
+    def delete(self, owner_id, target_ids):
+        table, owner_column, target_column, pk = self.sql_names()
+        placeholders = ', '.join(['%s'] * len(target_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} '
+                f'WHERE {owner_column} = %s '
+                f'AND {target_column} IN ({placeholders}) '
+                f'RETURNING {target_column}',
+                [owner_id, *target_ids]
+            )
+            return [target_id for target_id, in cursor.fetchall()]
+
+    def add(self, owner, target):
+        rows = self.insert(owner.pk, [target.pk])
+        if not rows:
+            return None
+        return self.model(pk=rows[0][0], **{self.owner_field: owner,
+                                            self.target_field: target})
+
+    def remove(self, owner, target):
+        return bool(self.delete(owner.pk, [target.pk]))
+
+    def add_many(self, owner, target_ids):
+        return {target_id for _, target_id in self.insert(owner.pk,
+                                                          target_ids)}
+
+    def remove_many(self, owner, target_ids):
+        return set(self.delete(owner.pk, target_ids))
+
+
+class ShoppingCartToggle(Toggle):
+    def insert(self, owner_id, target_ids):
+        with transaction.atomic():
+            lock_recipes(target_ids, share=True)
+            rows = super().insert(owner_id, target_ids)
+            apply_cart_change(owner_id,
+                              [target_id for _, target_id in rows], 1)
+        return rows
+
+    def delete(self, owner_id, target_ids):
+        with transaction.atomic():
+            lock_recipes(target_ids, share=True)
+            removed = super().delete(owner_id, target_ids)
+            apply_cart_change(owner_id, removed, -1)
+        return removed
+
+
+class SubscriptionToggle(Toggle):
+    def insert(self, owner_id, target_ids):
+        with transaction.atomic():
+            rows = super().insert(owner_id, target_ids)
+            backfill(owner_id, [target_id for _, target_id in rows])
+        return rows
+
+    def delete(self, owner_id, target_ids):
+        with transaction.atomic():
+            removed = super().delete(owner_id, target_ids)
+            trim(owner_id, removed)
+        return removed
+
+
+favorites = Toggle(Favorite, 'user', 'recipe')
+shopping_cart = ShoppingCartToggle(ShoppingCart, 'user', 'recipe')
+subscriptions = SubscriptionToggle(Subscription, 'subscriber', 'author')
@@ -0,0 +1,116 @@
+import base64
+import os
+import tempfile
+import weakref
+from contextlib import suppress
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (FileUploadHandler,
+                                             TemporaryFileUploadHandler)
+from django.template.defaultfilters import filesizeformat
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from api.constants import ALLOWED_IMAGE_TYPES, BASE64_CHUNK_SIZE
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Размер запроса превышает допустимый.'
+    default_code = 'payload_too_large'
+
+
+def max_request_size():
+    # base64 раздувает картинку на треть, остальные поля
+    # ограничены DATA_UPLOAD_MAX_MEMORY_SIZE.
+    return (settings.MAX_IMAGE_UPLOAD_SIZE * 4 // 3
+            + (settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0))
+
+
+def check_request_size(request):
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > max_request_size():
+        raise PayloadTooLarge()
+
+
+def check_image(size, content_type):
+    if content_type not in ALLOWED_IMAGE_TYPES:
+        raise ValidationError(
+            f'Недопустимый тип изображения: {content_type}!'
+        )
+    if size is not None and size > settings.MAX_IMAGE_UPLOAD_SIZE:
+        raise ValidationError(
+            'Размер изображения превышает '
+            f'{filesizeformat(settings.MAX_IMAGE_UPLOAD_SIZE)}!'
+        )
+
+
+class ImageUploadHandler(FileUploadHandler):
+    # Отсекает файл по типу и размеру ещё во время чтения тела запроса,
+    # сами данные пишет во временный файл следующий обработчик.
+    def new_file(self, field_name, file_name, content_type, content_length,
+                 charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type,
+                         content_length, charset, content_type_extra)
+        self.received = 0
+        self.check(content_length)
+
+    def check(self, size):
+        try:
+            check_image(size, self.content_type)
+        except ValidationError as error:
+            raise ValidationError({self.field_name: error.detail})
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        self.check(self.received)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def upload_handlers(request):
+    return [ImageUploadHandler(request), TemporaryFileUploadHandler(request)]
+
+
+def discard(path):
+    with suppress(FileNotFoundError):
+        os.remove(path)
+
+
+class DecodedImage(UploadedFile):
+    # Хранилище может переместить временный файл, поэтому он удаляется
+    # при сборке объекта, только если остался на месте.
+    def __init__(self, name, content_type, size):
+        file = tempfile.NamedTemporaryFile(
+            suffix='.upload', dir=settings.FILE_UPLOAD_TEMP_DIR, delete=False
+        )
+        super().__init__(file, name, content_type, size)
+        self.discard = weakref.finalize(self, discard, file.name)
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def decode_base64(data, offset, name, content_type):
+    # Декодирует строку кусками прямо во временный файл,
+    # размер проверяется до декодирования.
+    size = (len(data) - offset) * 3 // 4 - data.count('=', len(data) - 2)
+    check_image(size, content_type)
+    upload = DecodedImage(name, content_type, size)
+    try:
+        for start in range(offset, len(data), BASE64_CHUNK_SIZE):
+            upload.write(base64.b64decode(
+                data[start:start + BASE64_CHUNK_SIZE], validate=True
+            ))
+    except ValueError:
+        upload.close()
+        upload.discard()
+        raise ValidationError('Некорректный формат изображения!')
+    upload.seek(0)
+    return upload
@@ -1,30 +1,118 @@
+import csv
+import json
 from datetime import date
+from tempfile import SpooledTemporaryFile
 
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.negotiation import DefaultContentNegotiation
 
-from recipes.models import RecipeIngredient
+SHOPPING_LIST_FORMATS = ('txt', 'csv', 'json', 'pdf')
+SHOPPING_LIST_FILENAME = 'shopping_list'
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+SPOOL_MAX_SIZE = 1024 * 1024
 
 
-def shopping_cart(self, request, author):
-    shopping_cart_instance = author.shopping_cart.first()
-    sum_ingredients_in_recipes = RecipeIngredient.objects.filter(
-        recipe__shopping_cart=shopping_cart_instance
-    ).values(
+class ShoppingListNegotiation(DefaultContentNegotiation):
+    # ?format= выбирает формат файла, а не рендерер DRF.
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+def shopping_list_items(user):
+    return user.shopping_list.values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'
+    ).order_by(
         'ingredient__name', 'ingredient__measurement_unit'
-    ).annotate(
-        amounts=Sum('amount', distinct=True)
-    ).order_by('amounts')
-
-    today = date.today().strftime("%d-%m-%Y")
-    shopping_list = f'Список покупок на: {today}\n\n'
-    for ingredient in sum_ingredients_in_recipes:
-        shopping_list += (
-            f'{ingredient["ingredient__name"]} - '
-            f'{ingredient["amounts"]} '
-            f'{ingredient["ingredient__measurement_unit"]}\n'
+    ).iterator()
+
+
+def shopping_list_title():
+    return f'Список покупок на: {date.today().strftime("%d-%m-%Y")}'
+
+
+def render_txt(items):
+    yield f'{shopping_list_title()}\n\n'
+    for name, measurement_unit, amount in items:
+        yield f'{name} - {amount} {measurement_unit}\n'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def render_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for name, measurement_unit, amount in items:
+        yield writer.writerow((name, amount, measurement_unit))
+
+
+def render_json(items):
+    yield '['
+    separator = ''
+    for name, measurement_unit, amount in items:
+        yield separator + json.dumps(
+            {'name': name, 'amount': amount,
+             'measurement_unit': measurement_unit},
+            ensure_ascii=False
+        )
+        separator = ', '
+    yield ']'
+
+
+def render_pdf(items):
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
         )
-    filename = 'shopping_list.txt'
-    response = HttpResponse(shopping_list, content_type='text/plain')
+    # reportlab держит все страницы в памяти до save(), поэтому PDF
+    # собирается целиком до ответа: память растёт с числом страниц.
+    # Строк в списке не больше, чем ингредиентов в справочнике, так что
+    # от числа рецептов в корзине она не зависит.
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    document = canvas.Canvas(output, pagesize=A4)
+    _, height = A4
+    top = height - PDF_MARGIN
+    line = top
+    document.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+    for text in render_txt(items):
+        for row in text.splitlines():
+            if line < PDF_MARGIN:
+                document.showPage()
+                document.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+                line = top
+            document.drawString(PDF_MARGIN, line, row)
+            line -= PDF_LINE_HEIGHT
+    document.save()
+    output.seek(0)
+    return output
+
+
+RENDERERS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'json': (render_json, 'application/json'),
+}
+
+
+def shopping_cart(user, export_format='txt'):
+    filename = f'{SHOPPING_LIST_FILENAME}.{export_format}'
+    items = shopping_list_items(user)
+    if export_format == 'pdf':
+        return FileResponse(render_pdf(items), as_attachment=True,
+                            filename=filename,
+                            content_type='application/pdf')
+    render, content_type = RENDERERS[export_format]
+    response = StreamingHttpResponse(render(items),
+                                     content_type=content_type)
     response['Content-Disposition'] = f'attachment; filename={filename}'
     return response
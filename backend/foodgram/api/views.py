@@ -1,26 +1,43 @@
-import shortuuid
+from functools import partial
+
 from rest_framework import viewsets, status, mixins
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated, SAFE_METHODS
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from django.conf import settings
+from django.db.models import (Count, F, OuterRef, Prefetch, Subquery,
+                              Window)
+from django.db.models.functions import Coalesce, RowNumber
 from django_filters.rest_framework import DjangoFilterBackend
+from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
+from django.utils.cache import add_never_cache_headers
 from djoser.serializers import SetPasswordSerializer
 
-from recipes.models import Recipe, Tag, Ingredient
+from recipes.models import Recipe, Tag, Ingredient, TimelineEntry
+from recipes.counters import SHORT_LINK_HITS, VIEWS, counters
+from recipes.short_links import encode_short_id
 from api.serializers import (RecipeSerializer, TagSerializer,
                              IngredientSerializer, RecipeCreateSerializer,
                              UserSerializer, SubscriptionSerializer,
                              UserAvatarSerializer, FavoriteSerializer,
-                             ShoppingCartSerializer)
-from api.utils import shopping_cart
+                             ShoppingCartSerializer, RecipeIdsSerializer)
+from api import toggles
+from api.utils import (SHOPPING_LIST_FORMATS, ShoppingListNegotiation,
+                       shopping_cart)
+from api.cache import cached_response
+from api.fragments import render_recipes
+from api.ingredients import ingredient_index
 from api.permissions import (IsOwnerOrAdminOrReadOnly,
                              IsCurrentUserOrAdminOrReadOnly)
-from api.filters import IngredientSearchFilter, RecipeFilter
-from api.pagination import ApiPagination
-from api.constants import SHORT_ID_LENGTH
-from users.models import User
+from api.filters import RecipeFilter
+from api.pagination import (ApiPagination, FeedCursorPagination,
+                            RecipeCursorPagination,
+                            SubscriptionCursorPagination, is_cursor_mode)
+from api.short_links import resolve_short_id
+from api.uploads import check_request_size, upload_handlers
+from users.models import User, is_subscribed_expression
 
 
 class BaseReadOnlyViewSet(mixins.ListModelMixin,
@@ -29,6 +46,30 @@ class BaseReadOnlyViewSet(mixins.ListModelMixin,
     permission_classes = [AllowAny]
 
 
+class CursorPaginationMixin:
+    cursor_pagination_classes = {}
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            cursor_class = self.cursor_pagination_classes.get(self.action)
+            if cursor_class and is_cursor_mode(self.request):
+                self._paginator = cursor_class()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+
+
+class ImageUploadMixin:
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = upload_handlers(request)
+        return super().initialize_request(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        check_request_size(request)
+
+
 class TagViewSet(BaseReadOnlyViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
@@ -38,101 +79,253 @@ class TagViewSet(BaseReadOnlyViewSet):
 class IngredientViewSet(BaseReadOnlyViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = [IngredientSearchFilter]
-    search_fields = ['^name']
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name', '')
+        if name and request.query_params.get('fuzzy') in ('1', 'true'):
+            return Response(ingredient_index.fuzzy_search(name))
+        return Response(ingredient_index.search(name))
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            ingredient = ingredient_index.get(int(kwargs['pk']))
+        except ValueError:
+            ingredient = None
+        if ingredient is None:
+            raise Http404
+        return Response(ingredient)
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ImageUploadMixin, CursorPaginationMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (IsOwnerOrAdminOrReadOnly, )
     filter_backends = (DjangoFilterBackend, )
     pagination_class = ApiPagination
+    cursor_pagination_classes = {'list': RecipeCursorPagination}
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            return Recipe.objects.for_listing(self.request.user)
+        return Recipe.objects.all()
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeSerializer
         return RecipeCreateSerializer
 
-    @action(detail=True,
-            methods=['post', 'delete'],
-            permission_classes=[IsAuthenticated])
-    def favorite(self, request, *args, **kwargs):
+    def render_list(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(render_recipes(page, request))
+
+    def render_detail(self, request):
+        recipe = self.get_object()
+        rendered = render_recipes([recipe], request)
+        if not rendered:
+            # Рецепт удалили, пока собирался фрагмент.
+            raise Http404
+        return Response(rendered[0])
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return self.render_list(request)
+        return cached_response(
+            request, partial(self.render_list, request), 'list'
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            response = self.render_detail(request)
+        else:
+            response = cached_response(
+                request, partial(self.render_detail, request),
+                'retrieve', kwargs.get('pk')
+            )
+        if response.status_code == status.HTTP_200_OK:
+            counters.add(int(kwargs['pk']), VIEWS)
+        return response
+
+    @action(methods=['get'], permission_classes=[IsAuthenticated],
+            detail=False)
+    def feed(self, request):
+        # Страница ленты читается одним проходом по индексу,
+        # а рецепты для неё достаются по первичному ключу.
+        paginator = FeedCursorPagination()
+        entries = paginator.paginate_queryset(
+            TimelineEntry.objects.filter(subscriber=request.user).only(
+                'recipe_id', 'published_date'
+            ),
+            request, view=self
+        )
+        recipes = Recipe.objects.for_listing(request.user).in_bulk(
+            [entry.recipe_id for entry in entries]
+        )
+        page = [recipes[entry.recipe_id] for entry in entries
+                if entry.recipe_id in recipes]
+        return paginator.get_paginated_response(
+            render_recipes(page, request)
+        )
+
+    def toggle_recipe(self, request, toggle, serializer_class,
+                      missing_error, removed_message):
         recipe = get_object_or_404(Recipe, id=self.kwargs.get('pk'))
         user = self.request.user
 
         if request.method == 'POST':
-            if user.favorite_recipes.filter(recipe=recipe).exists():
+            item = toggle.add(user, recipe)
+            if item is None:
                 return Response({'errors': 'Рецепт уже добавлен!'},
                                 status=status.HTTP_400_BAD_REQUEST)
-            serializer = FavoriteSerializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-            serializer.save(user=user, recipe=recipe)
+            serializer = serializer_class(item)
             return Response(serializer.data,
                             status=status.HTTP_201_CREATED)
 
-        favorite_item = user.favorite_recipes.filter(recipe=recipe)
-        if favorite_item.exists():
-            favorite_item.delete()
-            return Response('Рецепт успешно удалён из избранного.',
+        if toggle.remove(user, recipe):
+            return Response(removed_message,
                             status=status.HTTP_204_NO_CONTENT)
 
-        return Response({'errors': 'Рецепт не существует в избранном'},
+        return Response({'errors': missing_error},
                         status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True,
+            methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated])
+    def favorite(self, request, *args, **kwargs):
+        return self.toggle_recipe(
+            request, toggles.favorites, FavoriteSerializer,
+            'Рецепт не существует в избранном',
+            'Рецепт успешно удалён из избранного.'
+        )
+
     @action(detail=True,
             methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=self.kwargs.get('pk'))
-        user = self.request.user
+        return self.toggle_recipe(
+            request, toggles.shopping_cart, ShoppingCartSerializer,
+            'Рецепт не существует в списке покупок',
+            'Рецепт успешно удалён из списка покупок.'
+        )
+
+    def toggle_recipes(self, request, toggle):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+        existing = set(Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).values_list('pk', flat=True))
+        found = [recipe_id for recipe_id in recipe_ids
+                 if recipe_id in existing]
 
         if request.method == 'POST':
-            if user.shopping_cart.filter(recipe=recipe).exists():
-                return Response({'errors': 'Рецепт уже добавлен!'},
-                                status=status.HTTP_400_BAD_REQUEST)
-            serializer = ShoppingCartSerializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-            serializer.save(user=user, recipe=recipe)
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
+            changed = toggle.add_many(request.user, found) if found else set()
+            done, skipped = 'added', 'exists'
+        else:
+            changed = (toggle.remove_many(request.user, found)
+                       if found else set())
+            done, skipped = 'removed', 'absent'
+
+        results = []
+        for recipe_id in recipe_ids:
+            if recipe_id not in existing:
+                result = 'not_found'
+            elif recipe_id in changed:
+                result = done
+            else:
+                result = skipped
+            results.append({'id': recipe_id, 'status': result})
+        return Response(results, status=status.HTTP_200_OK)
 
-        shopping_cart_item = user.shopping_cart.filter(recipe=recipe)
-        if shopping_cart_item.exists():
-            shopping_cart_item.delete()
-            return Response('Рецепт успешно удалён из списка покупок.',
-                            status=status.HTTP_204_NO_CONTENT)
+    @action(detail=False,
+            methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated],
+            url_path='favorite', url_name='favorite-bulk')
+    def favorite_bulk(self, request):
+        return self.toggle_recipes(request, toggles.favorites)
 
-        return Response({'errors': 'Рецепт не существует в списке покупок'},
-                        status=status.HTTP_400_BAD_REQUEST)
+    @action(detail=False,
+            methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated],
+            url_path='shopping_cart', url_name='shopping-cart-bulk')
+    def shopping_cart_bulk(self, request):
+        return self.toggle_recipes(request, toggles.shopping_cart)
 
     @action(detail=False,
             methods=['get'],
-            permission_classes=[IsAuthenticated])
+            permission_classes=[IsAuthenticated],
+            content_negotiation_class=ShoppingListNegotiation)
     def download_shopping_cart(self, request):
-        user = self.request.user
-        if user.shopping_cart.exists():
-            return shopping_cart(self, request, user)
+        export_format = request.query_params.get('format', 'txt')
+        if export_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'format': 'Доступные форматы: '
+                           + ', '.join(SHOPPING_LIST_FORMATS)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return shopping_cart(self.request.user, export_format)
 
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_link(self, request, pk=None):
-        recipe = get_object_or_404(Recipe, id=pk)
-
-        if not recipe.short_id:
-            recipe.short_id = shortuuid.uuid()[:SHORT_ID_LENGTH]
-            recipe.save(update_fields=['short_id'])
-
-        short_link = f'{settings.SITE_URL}/s/{recipe.short_id}'
+        recipe = get_object_or_404(Recipe.objects.only('short_id'), id=pk)
+        short_id = recipe.short_id or encode_short_id(recipe.pk)
+        short_link = (f'{settings.SITE_URL}/'
+                      f'{settings.PREFIX_SHORT_LINK_RECIPE}{short_id}')
         return Response({'short-link': short_link}, status=status.HTTP_200_OK)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ImageUploadMixin, CursorPaginationMixin,
+                  viewsets.ModelViewSet):
     queryset = User.objects.all()
     permission_classes = (IsCurrentUserOrAdminOrReadOnly, )
     pagination_class = ApiPagination
+    cursor_pagination_classes = {'subscriptions': SubscriptionCursorPagination}
     serializer_class = UserSerializer
 
+    def get_queryset(self):
+        return User.objects.annotate(
+            is_subscribed=is_subscribed_expression(self.request.user)
+        ).order_by('id')
+
+    def get_recipes_limit(self):
+        limit = self.request.query_params.get('recipes_limit')
+        if not limit:
+            return None
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = -1
+        if limit < 0:
+            raise ValidationError({'recipes_limit': 'Укажите целое '
+                                                    'неотрицательное число!'})
+        return limit or None
+
+    def get_subscriptions(self, limit=None):
+        # Последние рецепты всех авторов страницы достаются одним запросом.
+        recipes = Recipe.objects.only(
+            'id', 'author_id', 'name', 'image', 'image_renditions',
+            'cooking_time', 'published_date'
+        ).order_by('-published_date', '-id')
+        if limit:
+            recipes = recipes.annotate(row_number=Window(
+                RowNumber(), partition_by=F('author_id'),
+                order_by=(F('published_date').desc(), F('id').desc())
+            )).filter(row_number__lte=limit)
+        # Подзапрос вместо JOIN не раздувает GROUP BY и запрос количества.
+        recipes_count = Recipe.objects.filter(
+            author=OuterRef('author')
+        ).order_by().values('author').annotate(
+            count=Count('pk')
+        ).values('count')
+        return self.request.user.follower.select_related('author').annotate(
+            recipes_count=Coalesce(Subquery(recipes_count), 0),
+            is_subscribed=is_subscribed_expression(self.request.user,
+                                                   'author'),
+        ).prefetch_related(Prefetch('author__recipes', queryset=recipes,
+                                    to_attr='latest_recipes')).order_by('-id')
+
     @action(methods=['get'], permission_classes=[IsAuthenticated],
             detail=False)
     def me(self, request):
@@ -148,23 +341,24 @@ class UserViewSet(viewsets.ModelViewSet):
         user = self.request.user
 
         if request.method == 'POST':
-            if user.follower.filter(author=author).exists():
+            limit = self.get_recipes_limit()
+            if user == author:
+                return Response({'errors': 'Невозможно подписаться'
+                                           ' на самого себя'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            subscription = toggles.subscriptions.add(user, author)
+            if subscription is None:
                 return Response({'errors': 'Вы уже подписаны'
                                            ' на этого пользователя'},
                                 status=status.HTTP_400_BAD_REQUEST)
-
             serializer = SubscriptionSerializer(
-                data=request.data,
-                context={'request': request, 'author': author}
+                self.get_subscriptions(limit).get(pk=subscription.pk),
+                context={'request': request}
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save(author=author, subscriber=user)
             return Response(serializer.data,
                             status=status.HTTP_201_CREATED)
 
-        subscription = user.follower.filter(author=author)
-        if subscription.exists():
-            subscription.delete()
+        if toggles.subscriptions.remove(user, author):
             return Response({'message': 'Успешная отписка'},
                             status=status.HTTP_204_NO_CONTENT)
 
@@ -185,8 +379,9 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(methods=['get'], permission_classes=[IsAuthenticated],
             detail=False)
     def subscriptions(self, request):
-        subscriptions = self.request.user.follower.all()
-        pages = self.paginate_queryset(subscriptions)
+        pages = self.paginate_queryset(
+            self.get_subscriptions(self.get_recipes_limit())
+        )
         serializer = SubscriptionSerializer(pages, many=True,
                                             context={'request': request})
         return self.get_paginated_response(serializer.data)
@@ -196,7 +391,9 @@ class UserViewSet(viewsets.ModelViewSet):
     def avatar(self, request):
         user = request.user
         if request.method == 'DELETE':
-            user.avatar.delete(save=True)
+            # Файл может быть общим, его удалит сборщик по счётчику ссылок.
+            user.avatar = None
+            user.save(update_fields=['avatar'])
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         if 'avatar' not in request.data:
@@ -207,3 +404,15 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+def short_link_redirect(request, short_id):
+    recipe_id = resolve_short_id(short_id)
+    if recipe_id is None:
+        raise Http404
+    counters.add(recipe_id, SHORT_LINK_HITS)
+    # Временный и не кешируемый редирект: иначе браузер запомнит его
+    # и повторные переходы не дойдут до счётчика.
+    response = HttpResponseRedirect(f'/recipes/{recipe_id}')
+    add_never_cache_headers(response)
+    return response
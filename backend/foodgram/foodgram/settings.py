@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 
 from django.core.management.utils import get_random_secret_key
@@ -29,6 +30,8 @@ INSTALLED_APPS = [
     'recipes.apps.RecipesConfig',
     'django_filters',
     'api.apps.ApiConfig',
+    'jobs.apps.JobsConfig',
+    'mediafiles.apps.MediaFilesConfig',
     'django_extensions',
 ]
 
@@ -81,6 +84,82 @@ DATABASES = {
     }
 }
 
+REDIS_URL = os.getenv('REDIS_URL')
+
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', '/tmp/foodgram_cache')
+
+if REDIS_URL:
+    # Общий кеш для backend и worker: сброс поколений в одном контейнере
+    # виден в другом. Вытесняются только ключи со сроком жизни.
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'persistent': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'persistent',
+            'TIMEOUT': None,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_LOCATION,
+            'OPTIONS': {
+                'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100_000)),
+            },
+        },
+        # Поколения и счётчики не должны попадать под вытеснение
+        # основного кеша.
+        'persistent': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': f'{CACHE_LOCATION}_persistent',
+            'TIMEOUT': None,
+            'OPTIONS': {
+                'MAX_ENTRIES': sys.maxsize,
+            },
+        },
+    }
+
+CACHE_STATS_FLUSH_INTERVAL = float(
+    os.getenv('CACHE_STATS_FLUSH_INTERVAL', 10)
+)
+
+RECIPES_CACHE_TIMEOUT = int(os.getenv('RECIPES_CACHE_TIMEOUT', 60 * 15))
+
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10_000))
+
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 60))
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+
+INGREDIENT_FUZZY_THRESHOLD = float(
+    os.getenv('INGREDIENT_FUZZY_THRESHOLD', 0.3)
+)
+
+MAX_IMAGE_UPLOAD_SIZE = int(
+    os.getenv('MAX_IMAGE_UPLOAD_SIZE', 10 * 1024 * 1024)
+)
+
+MEDIA_DELETE_DELAY = int(os.getenv('MEDIA_DELETE_DELAY', 60 * 10))
+
+JOBS_BATCH_SIZE = int(os.getenv('JOBS_BATCH_SIZE', 10))
+
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', 1))
+
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', 5))
+
+JOBS_RETRY_DELAY = int(os.getenv('JOBS_RETRY_DELAY', 30))
+
+JOBS_LOCK_TIMEOUT = int(os.getenv('JOBS_LOCK_TIMEOUT', 60 * 10))
+
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 50))
+
+FEED_FAN_OUT_BATCH_SIZE = int(os.getenv('FEED_FAN_OUT_BATCH_SIZE', 1000))
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -113,6 +192,15 @@ STATIC_ROOT = '/backend_static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/app/media/'
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'mediafiles.storage.HashedFileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -120,7 +208,7 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -131,4 +219,15 @@ REST_FRAMEWORK = {
 
 PREFIX_SHORT_LINK_RECIPE = 's/'
 
+SHORT_LINK_CACHE_SIZE = int(os.getenv('SHORT_LINK_CACHE_SIZE', 10_000))
+
+SHORT_LINK_CACHE_TIMEOUT = int(os.getenv('SHORT_LINK_CACHE_TIMEOUT', 60 * 10))
+
+COUNTERS_FLUSH_INTERVAL = float(os.getenv('COUNTERS_FLUSH_INTERVAL', 10))
+
 SITE_URL = 'https://foodgram.example.org'
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
@@ -1,8 +1,13 @@
+from django.conf import settings
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 
+from api.views import short_link_redirect
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/', include('api.urls'))
+    path('api/', include('api.urls')),
+    re_path(rf'^{settings.PREFIX_SHORT_LINK_RECIPE}'
+            r'(?P<short_id>[0-9A-Za-z]+)/?$',
+            short_link_redirect, name='short-link'),
 ]
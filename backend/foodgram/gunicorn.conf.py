@@ -0,0 +1,4 @@
+def worker_exit(server, worker):
+    # Накопленные счётчики просмотров не должны теряться при остановке.
+    from recipes.counters import counters
+    counters.flush()
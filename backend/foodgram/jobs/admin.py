@@ -0,0 +1,11 @@
+from django.contrib import admin
+
+from jobs.models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'name', 'status', 'attempts',
+                    'run_after', 'created')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'key', 'error')
@@ -0,0 +1,43 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jobs.queue import run_pending
+
+
+class Command(BaseCommand):
+    help = 'Выполнять фоновые задачи из очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить накопившиеся задачи и выйти')
+        parser.add_argument('--batch', type=int,
+                            default=settings.JOBS_BATCH_SIZE,
+                            help='Сколько задач брать за раз')
+        parser.add_argument('--sleep', type=float,
+                            default=settings.JOBS_POLL_INTERVAL,
+                            help='Пауза между опросами пустой очереди')
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        processed = 0
+        while not self.stopping:
+            close_old_connections()
+            claimed = run_pending(options['batch'])
+            processed += claimed
+            if claimed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано задач: {processed}'
+        ))
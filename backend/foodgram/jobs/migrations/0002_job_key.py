@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-17 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='key',
+            field=models.CharField(blank=True, help_text='Одинаковые задачи с ключом не копятся в очереди', max_length=200, verbose_name='Ключ'),
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending'), models.Q(('key', ''), _negated=True)), fields=('name', 'key'), name='unique_pending_job'),
+        ),
+    ]
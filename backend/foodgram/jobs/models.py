@@ -0,0 +1,71 @@
+from django.db import models
+from django.utils import timezone
+
+MAX_LENGTH_100 = 100
+MAX_LENGTH_200 = 200
+
+
+class Job(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'В очереди'
+        RUNNING = 'running', 'Выполняется'
+        FAILED = 'failed', 'Ошибка'
+
+    name = models.CharField(
+        max_length=MAX_LENGTH_100,
+        verbose_name='Задача',
+    )
+    payload = models.JSONField(
+        default=dict,
+        verbose_name='Параметры',
+    )
+    key = models.CharField(
+        max_length=MAX_LENGTH_200,
+        blank=True,
+        verbose_name='Ключ',
+        help_text='Одинаковые задачи с ключом не копятся в очереди',
+    )
+    status = models.CharField(
+        max_length=MAX_LENGTH_100,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name='Статус',
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попытки',
+    )
+    run_after = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Выполнить после',
+    )
+    locked_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Взята в работу',
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка',
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Создана',
+    )
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after'],
+                         name='job_queue_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'key'],
+                condition=models.Q(status='pending') & ~models.Q(key=''),
+                name='unique_pending_job',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.get_status_display()})'
@@ -0,0 +1,92 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from jobs.models import Job
+
+logger = logging.getLogger(__name__)
+
+handlers = {}
+
+
+def task(name):
+    def register(handler):
+        handlers[name] = handler
+        return handler
+    return register
+
+
+def enqueue(name, /, delay=None, key='', **payload):
+    # Задача пишется в ту же транзакцию, что и изменения,
+    # и становится видна воркеру только после коммита.
+    run_after = timezone.now()
+    if delay:
+        run_after += timedelta(seconds=delay)
+    job = Job(name=name, payload=payload, run_after=run_after, key=key)
+    if key:
+        # Такая же задача уже ждёт в очереди, вторая её не дополнит.
+        Job.objects.bulk_create([job], ignore_conflicts=True)
+    else:
+        job.save()
+    return job
+
+
+def claim(limit):
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    with transaction.atomic():
+        jobs = list(Job.objects.select_for_update(skip_locked=True).filter(
+            Q(status=Job.Status.PENDING, run_after__lte=now)
+            | Q(status=Job.Status.RUNNING, locked_at__lt=stale)
+        )[:limit])
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=Job.Status.RUNNING, locked_at=now
+        )
+    return jobs
+
+
+def fail(job, error):
+    attempts = job.attempts + 1
+    changes = {'attempts': attempts, 'error': error, 'locked_at': None}
+    if attempts >= settings.JOBS_MAX_ATTEMPTS:
+        changes['status'] = Job.Status.FAILED
+    else:
+        changes['status'] = Job.Status.PENDING
+        changes['run_after'] = timezone.now() + timedelta(
+            seconds=settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1)
+        )
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job.pk).update(**changes)
+    except IntegrityError:
+        # Пока задача выполнялась, такую же поставили заново: повтор
+        # выполнит она.
+        Job.objects.filter(pk=job.pk).delete()
+
+
+def run(job):
+    handler = handlers.get(job.name)
+    if handler is None:
+        fail(job, f'Неизвестная задача: {job.name}')
+        return False
+    try:
+        handler(**job.payload)
+    except Exception:
+        logger.exception('Задача %s (%s) завершилась с ошибкой',
+                         job.pk, job.name)
+        fail(job, traceback.format_exc())
+        return False
+    Job.objects.filter(pk=job.pk).delete()
+    return True
+
+
+def run_pending(limit=None):
+    jobs = claim(limit or settings.JOBS_BATCH_SIZE)
+    for job in jobs:
+        run(job)
+    return len(jobs)
@@ -0,0 +1,10 @@
+from django.contrib import admin
+
+from mediafiles.models import MediaFile
+
+
+@admin.register(MediaFile)
+class MediaFileAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'name', 'size', 'refcount', 'created')
+    list_filter = ('refcount', )
+    search_fields = ('name', )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from mediafiles.models import MediaFile
+from mediafiles.refcounts import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать число ссылок на загруженные файлы'
+
+    def handle(self, *args, **options):
+        rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов с ссылками: '
+            f'{MediaFile.objects.filter(refcount__gt=0).count()}'
+        ))
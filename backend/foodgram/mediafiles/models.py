@@ -0,0 +1,29 @@
+from django.db import models
+
+MAX_LENGTH_255 = 255
+
+
+class MediaFile(models.Model):
+    name = models.CharField(
+        max_length=MAX_LENGTH_255,
+        unique=True,
+        verbose_name='Имя файла',
+    )
+    size = models.BigIntegerField(
+        default=0,
+        verbose_name='Размер',
+    )
+    refcount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число ссылок',
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Загружен',
+    )
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount})'
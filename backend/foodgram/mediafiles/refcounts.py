@@ -0,0 +1,186 @@
+from collections import Counter
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import Signal
+from django.utils import timezone
+
+from jobs.queue import enqueue, task
+from mediafiles.models import MediaFile
+
+ORIGINALS = '_media_names'
+REBUILD_BATCH_SIZE = 1000
+DELETE_TASK = 'mediafiles.delete'
+
+tracked = {}
+
+file_deleted = Signal()
+
+
+def file_size(name):
+    try:
+        return default_storage.size(name)
+    except OSError:
+        return 0
+
+
+def acquire(name):
+    table = connection.ops.quote_name(MediaFile._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (name, size, refcount, created) '
+            f'VALUES (%s, %s, 1, %s) '
+            f'ON CONFLICT (name) DO UPDATE '
+            f'SET refcount = {table}.refcount + 1, size = excluded.size',
+            [name, file_size(name),
+             connection.ops.adapt_datetimefield_value(timezone.now())]
+        )
+
+
+def lock_file(name):
+    # Загрузка того же файла, отложенное удаление и сборка мусора
+    # проходят по очереди через блокировку строки с его именем.
+    table = connection.ops.quote_name(MediaFile._meta.db_table)
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (name, size, refcount, created) '
+                f'VALUES (%s, %s, 0, %s) ON CONFLICT (name) DO NOTHING',
+                [name, file_size(name),
+                 connection.ops.adapt_datetimefield_value(timezone.now())]
+            )
+        # Строку могли удалить, пока мы ждали блокировку: тогда заново.
+        media = MediaFile.objects.select_for_update().filter(
+            name=name
+        ).first()
+        if media is not None:
+            return media
+
+
+def release(name):
+    table = connection.ops.quote_name(MediaFile._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET refcount = refcount - 1 '
+            f'WHERE name = %s AND refcount > 0 RETURNING refcount',
+            [name]
+        )
+        row = cursor.fetchone()
+    if row and not row[0]:
+        # Задача станет видна воркеру только после коммита.
+        enqueue(DELETE_TASK, delay=settings.MEDIA_DELETE_DELAY, name=name)
+
+
+def recently_modified(name):
+    try:
+        modified = default_storage.get_modified_time(name)
+    except FileNotFoundError:
+        return False
+    return modified > timezone.now() - timedelta(
+        seconds=settings.MEDIA_DELETE_DELAY
+    )
+
+
+def remove(name):
+    default_storage.delete(name)
+    file_deleted.send(sender=MediaFile, name=name)
+
+
+@task(DELETE_TASK)
+def delete_file(name):
+    with transaction.atomic():
+        media = MediaFile.objects.select_for_update().filter(
+            name=name
+        ).first()
+        if media is None or media.refcount:
+            return
+        if recently_modified(name):
+            enqueue(DELETE_TASK, delay=settings.MEDIA_DELETE_DELAY,
+                    name=name)
+            return
+        media.delete()
+        # Файл удаляется под блокировкой: загрузка того же содержимого
+        # дождётся коммита и запишет файл заново.
+        remove(name)
+
+
+def stored_name(instance, field):
+    value = instance.__dict__.get(field)
+    return getattr(value, 'name', value) or None
+
+
+def remember(sender, instance, **kwargs):
+    # Отложенные поля не трогаем, чтобы не делать лишних запросов.
+    setattr(instance, ORIGINALS, {
+        field: stored_name(instance, field)
+        for field in tracked[sender] if field in instance.__dict__
+    })
+
+
+def saved(sender, instance, update_fields=None, **kwargs):
+    originals = getattr(instance, ORIGINALS, {})
+    for field in tracked[sender]:
+        if update_fields is not None and field not in update_fields:
+            continue
+        if field not in instance.__dict__:
+            continue
+        old = originals.get(field)
+        new = stored_name(instance, field)
+        if old == new:
+            continue
+        if new:
+            acquire(new)
+        if old:
+            release(old)
+        originals[field] = new
+    setattr(instance, ORIGINALS, originals)
+
+
+def deleted(sender, instance, **kwargs):
+    for field in tracked[sender]:
+        name = stored_name(instance, field)
+        if name:
+            release(name)
+
+
+def track(model, *fields):
+    tracked.setdefault(model, []).extend(fields)
+    post_init.connect(remember, sender=model)
+    post_save.connect(saved, sender=model)
+    post_delete.connect(deleted, sender=model)
+
+
+def referenced_counts():
+    for model, fields in tracked.items():
+        for field in fields:
+            yield from model.objects.exclude(
+                **{f'{field}__isnull': True}
+            ).exclude(**{field: ''}).values_list(field).annotate(
+                count=Count('pk')
+            ).order_by().iterator()
+
+
+def rebuild():
+    with transaction.atomic():
+        MediaFile.objects.update(refcount=0)
+        rows = referenced_counts()
+        while batch := list(islice(rows, REBUILD_BATCH_SIZE)):
+            # Один файл может быть и картинкой рецепта, и аватаром.
+            counts = Counter()
+            for name, count in batch:
+                counts[name] += count
+            counts.update(dict(MediaFile.objects.filter(
+                name__in=counts
+            ).values_list('name', 'refcount')))
+            MediaFile.objects.bulk_create(
+                [MediaFile(name=name, size=file_size(name), refcount=count)
+                 for name, count in counts.items()],
+                update_conflicts=True,
+                unique_fields=['name'],
+                update_fields=['size', 'refcount'],
+            )
@@ -0,0 +1,46 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+from mediafiles.refcounts import lock_file
+
+HASHED_DIR = 'files'
+
+
+def file_digest(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class HashedFileSystemStorage(FileSystemStorage):
+    # Файл называется по хешу содержимого: одинаковые картинки
+    # хранятся один раз, а имя никогда не меняет смысл.
+    def __init__(self, **kwargs):
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def hashed_name(self, name, content):
+        digest = file_digest(content)
+        ext = os.path.splitext(name)[1].lower()
+        return f'{HASHED_DIR}/{digest[:2]}/{digest}{ext}'
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        with transaction.atomic():
+            lock_file(name)
+            if self.exists(name):
+                # Свежая дата изменения защищает файл от сборщика,
+                # пока новая ссылка на него не закоммичена.
+                os.utime(self.path(name))
+                return name
+            return super().save(name, content, max_length)
@@ -1,7 +1,8 @@
 from django.contrib import admin
 
-from recipes.models import (Tag, Ingredient, Recipe,
-                            RecipeIngredient, Favorite, ShoppingCart)
+from recipes.models import (Tag, Ingredient, Recipe, RecipeIngredient,
+                            Favorite, ShoppingCart, ShoppingListItem,
+                            TimelineEntry)
 
 
 @admin.register(Tag)
@@ -22,17 +23,33 @@ class IngredientAdmin(admin.ModelAdmin):
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('pk', 'author', 'name',
                     'image', 'text', 'cooking_time',
-                    'get_tags', 'get_ingredients', 'published_date')
+                    'get_tags', 'get_ingredients', 'published_date',
+                    'get_views', 'get_short_link_hits')
     list_filter = ('name', 'author', 'tags', )
     search_fields = ('name', 'author', )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_counters().select_related(
+            'author'
+        ).prefetch_related('tags', 'recipe_ingredient__ingredient')
+
+    def get_views(self, obj):
+        return obj.views
+    get_views.short_description = "Просмотры"
+    get_views.admin_order_field = 'views'
+
+    def get_short_link_hits(self, obj):
+        return obj.short_link_hits
+    get_short_link_hits.short_description = "Переходы по ссылке"
+    get_short_link_hits.admin_order_field = 'short_link_hits'
+
     def get_tags(self, obj):
         return ", ".join([tag.name for tag in obj.tags.all()])
     get_tags.short_description = "Теги"
 
     def get_ingredients(self, obj):
         return ", ".join([ri.ingredient.name
-                          for ri in obj.recipeingredient_set.all()])
+                          for ri in obj.recipe_ingredient.all()])
     get_ingredients.short_description = "Ингредиенты"
 
 
@@ -51,3 +68,15 @@ class FavoriteAdmin(admin.ModelAdmin):
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'recipe')
     search_fields = ('user', )
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'ingredient', 'amount')
+    search_fields = ('user', )
+
+
+@admin.register(TimelineEntry)
+class TimelineEntryAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'subscriber', 'recipe', 'author', 'published_date')
+    search_fields = ('subscriber', )
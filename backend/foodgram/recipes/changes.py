@@ -0,0 +1,41 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.dispatch import Signal
+
+from recipes.models import Recipe
+
+recipes_changed = Signal()
+
+pending = threading.local()
+
+
+def send_recipes_changed(recipe_ids):
+    recipe_ids = set(recipe_ids)
+    if recipe_ids:
+        recipes_changed.send(sender=Recipe, recipe_ids=recipe_ids)
+
+
+def notify_recipes_changed(recipe_ids):
+    batch = getattr(pending, 'recipe_ids', None)
+    if batch is not None:
+        batch.update(recipe_ids)
+        return
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: send_recipes_changed(recipe_ids))
+
+
+@contextmanager
+def batch_recipe_changes():
+    # Все изменения внутри блока дают одно событие после коммита.
+    if getattr(pending, 'recipe_ids', None) is not None:
+        yield
+        return
+    pending.recipe_ids = set()
+    try:
+        yield
+        recipe_ids = pending.recipe_ids
+    finally:
+        pending.recipe_ids = None
+    notify_recipes_changed(recipe_ids)
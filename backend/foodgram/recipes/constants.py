@@ -4,3 +4,8 @@ MAX_LENGTH_7 = 7
 MAX_LENGTH_10 = 10
 MIN_VALUE_VALIDATOR = 1
 MAX_VALUE_VALIDATOR = 32_000
+SHORT_ID_ALPHABET = ('0123456789abcdefghijklmnopqrstuvwxyz'
+                     'ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+SHORT_ID_LENGTH = 7
+SHORT_ID_MULTIPLIER = 2_176_477_521_739
+SHORT_ID_OFFSET = 1_234_567_891
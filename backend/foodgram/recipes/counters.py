@@ -0,0 +1,92 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection
+
+from recipes.models import Recipe, RecipeStats
+
+logger = logging.getLogger(__name__)
+
+VIEWS = 'views'
+SHORT_LINK_HITS = 'short_link_hits'
+FIELDS = (VIEWS, SHORT_LINK_HITS)
+
+
+def write(pending):
+    # Один INSERT ... SELECT на все накопленные рецепты: строки удалённых
+    # рецептов отсекает JOIN, а счётчики прибавляются к уже записанным.
+    recipe_ids = sorted(pending)
+    quote = connection.ops.quote_name
+    stats = quote(RecipeStats._meta.db_table)
+    recipes = quote(Recipe._meta.db_table)
+    columns, params = [], []
+    for field in FIELDS:
+        cases = ' '.join(['WHEN %s THEN %s'] * len(recipe_ids))
+        columns.append(f'CASE id {cases} ELSE 0 END')
+        for recipe_id in recipe_ids:
+            params += [recipe_id, pending[recipe_id][field]]
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    updates = ', '.join(f'{field} = {stats}.{field} + excluded.{field}'
+                        for field in FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {stats} (recipe_id, {", ".join(FIELDS)}) '
+            f'SELECT id, {", ".join(columns)} FROM {recipes} '
+            f'WHERE id IN ({placeholders}) ORDER BY id '
+            f'ON CONFLICT (recipe_id) DO UPDATE SET {updates}',
+            [*params, *recipe_ids]
+        )
+
+
+class CounterBuffer:
+    # Копит приращения в памяти процесса и раз в интервал
+    # записывает их одним запросом из фонового потока.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.pending = defaultdict(Counter)
+        self.thread = None
+
+    def add(self, recipe_id, field, amount=1):
+        with self.lock:
+            self.pending[recipe_id][field] += amount
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name='recipe-counters', daemon=True
+                )
+                self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(settings.COUNTERS_FLUSH_INTERVAL)
+            self.flush()
+            close_old_connections()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(Counter)
+        if not pending:
+            return 0
+        try:
+            write(pending)
+        except DatabaseError:
+            logger.exception('Не удалось записать счётчики рецептов')
+            with self.lock:
+                for recipe_id, counts in pending.items():
+                    self.pending[recipe_id].update(counts)
+            return 0
+        return len(pending)
+
+
+counters = CounterBuffer()
+
+# После fork поток и накопленное родителем в дочерний процесс не переходят.
+os.register_at_fork(after_in_child=counters.reset)
+atexit.register(counters.flush)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.short_links import encode_short_id
+
+
+class Command(BaseCommand):
+    help = 'Записать короткие ссылки рецептам, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько рецептов обновлять за один запрос')
+
+    def handle(self, *args, **options):
+        count = last = 0
+        while recipes := list(Recipe.objects.filter(
+            short_id__isnull=True, pk__gt=last
+        ).order_by('pk').only('pk')[:options['batch_size']]):
+            for recipe in recipes:
+                recipe.short_id = encode_short_id(recipe.pk)
+            Recipe.objects.bulk_update(recipes, ['short_id'])
+            count += len(recipes)
+            last = recipes[-1].pk
+        self.stdout.write(self.style.SUCCESS(
+            f'Заполнено коротких ссылок: {count}'
+        ))
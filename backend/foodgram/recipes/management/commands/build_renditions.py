@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.renditions import (renditions_field, renditions_outdated,
+                            schedule_renditions)
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Поставить в очередь сборку уменьшенных копий картинок'
+
+    def handle(self, *args, **options):
+        scheduled = 0
+        with transaction.atomic():
+            for model, field in ((Recipe, 'image'), (User, 'avatar')):
+                for instance in model.objects.only(
+                    'pk', field, renditions_field(field)
+                ).iterator():
+                    if (getattr(instance, field)
+                            and renditions_outdated(instance, field)):
+                        schedule_renditions(instance, field)
+                        scheduled += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Поставлено в очередь: {scheduled}'
+        ))
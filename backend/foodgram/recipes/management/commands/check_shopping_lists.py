@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.shopping_list import expected_items, rebuild, stored_items
+
+
+class Command(BaseCommand):
+    help = 'Сверить списки покупок с корзинами и пересобрать их'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Пересобрать списки при расхождениях')
+
+    def diff(self):
+        expected = dict(self.by_key(expected_items()))
+        mismatches = 0
+        for key, stored in self.by_key(stored_items()):
+            amount = expected.pop(key, None)
+            if amount != stored:
+                mismatches += 1
+                self.report(key, amount, stored)
+        for key, amount in expected.items():
+            mismatches += 1
+            self.report(key, amount, None)
+        return mismatches
+
+    def by_key(self, rows):
+        for user_id, ingredient_id, amount in rows:
+            yield (user_id, ingredient_id), amount
+
+    def report(self, key, expected, stored):
+        user_id, ingredient_id = key
+        self.stdout.write(
+            f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+            f'ожидается {expected}, в списке {stored}'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            mismatches = self.diff()
+            if mismatches and options['fix']:
+                rebuild()
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено расхождений: {mismatches}'
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'Найдено расхождений: {mismatches}'
+            ))
@@ -0,0 +1,106 @@
+import os
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from api.renditions import rendition_source
+from mediafiles.models import MediaFile
+from mediafiles.refcounts import lock_file, tracked
+
+
+def walk(root):
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry
+
+
+def prune(root):
+    for path, _, _ in os.walk(root, topdown=False):
+        if path != root and not os.listdir(path):
+            os.rmdir(path)
+
+
+class Command(BaseCommand):
+    help = 'Найти и удалить файлы, на которые не ссылается база'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что можно удалить')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько файлов проверять за один запрос')
+
+    def referenced(self, names):
+        found = set()
+        for model, fields in tracked.items():
+            for field in fields:
+                found.update(model.objects.filter(
+                    **{f'{field}__in': names}
+                ).values_list(field, flat=True))
+        return found
+
+    def orphans(self, batch, root, cutoff):
+        files = {}
+        for entry in batch:
+            stat = entry.stat(follow_symlinks=False)
+            # Свежие файлы могут принадлежать ещё не закоммиченной записи.
+            if stat.st_mtime > cutoff:
+                continue
+            name = os.path.relpath(entry.path, root).replace(os.sep, '/')
+            files[name] = (entry.path, stat.st_size)
+        sources = {name: rendition_source(name) or name for name in files}
+        used = self.referenced(set(sources.values()))
+        return {name: (*files[name], source)
+                for name, source in sources.items() if source not in used}
+
+    def remove(self, name, path, source, cutoff):
+        # Перед удалением всё перепроверяется под блокировкой исходного
+        # файла: его могли только что загрузить повторно.
+        with transaction.atomic():
+            lock_file(source)
+            try:
+                if os.stat(path).st_mtime > cutoff:
+                    return False
+            except FileNotFoundError:
+                return False
+            if self.referenced({source}):
+                return False
+            os.remove(path)
+            MediaFile.objects.filter(
+                Q(name=name) | Q(name=source, refcount=0)
+            ).delete()
+        return True
+
+    def handle(self, *args, **options):
+        root = str(settings.MEDIA_ROOT)
+        dry_run = options['dry_run']
+        cutoff = (timezone.now() - timedelta(
+            seconds=settings.MEDIA_DELETE_DELAY
+        )).timestamp()
+        count = reclaimable = 0
+        entries = walk(root) if os.path.isdir(root) else iter(())
+        while batch := list(islice(entries, options['batch_size'])):
+            orphans = self.orphans(batch, root, cutoff)
+            for name, (path, size, source) in orphans.items():
+                if not dry_run and not self.remove(name, path, source,
+                                                   cutoff):
+                    continue
+                count += 1
+                reclaimable += size
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{name} ({filesizeformat(size)})')
+        if not dry_run and os.path.isdir(root):
+            prune(root)
+        action = 'Можно удалить' if dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {count}, '
+            f'освобождается {filesizeformat(reclaimable)}'
+        ))
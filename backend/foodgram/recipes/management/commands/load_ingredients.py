@@ -1,23 +1,137 @@
 import csv
-from django.core.management.base import BaseCommand
-from recipes.models import Ingredient
+import json
 import os
+import re
+from functools import partial
+from itertools import chain, islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.cache import bump_generation
+from api.ingredients import GENERATION_KEY
+from recipes.constants import MAX_LENGTH_50, MAX_LENGTH_200
+from recipes.models import Ingredient
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), 'ingredients.csv')
+READ_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def read_csv(file):
+    yield from csv.reader(file)
+
+
+def read_json(file):
+    # Массив разбирается по мере чтения, целиком файл в память не попадает.
+    # В буфере остаётся только неразобранный хвост. Незаконченный элемент
+    # разбирается заново, лишь когда буфер вырос вдвое.
+    decoder = json.JSONDecoder()
+    buffer, opened, closed = '', False, False
+    wanted = 0
+    chunks = iter(partial(file.read, READ_SIZE), '')
+    for chunk in chain(chunks, [None]):
+        if chunk is not None:
+            buffer += chunk
+            if len(buffer) < wanted:
+                continue
+        wanted = 0
+        position = 0
+        while not closed:
+            position = WHITESPACE.match(buffer, position).end()
+            if position == len(buffer):
+                break
+            if not opened:
+                if buffer[position] != '[':
+                    raise CommandError('В файле JSON ожидается массив!')
+                opened = True
+                position += 1
+                continue
+            if buffer[position] == ',':
+                position += 1
+                continue
+            if buffer[position] == ']':
+                closed = True
+                position += 1
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                wanted = 2 * (len(buffer) - position)
+                break
+            yield item
+        buffer = buffer[position:]
+    if not closed or buffer.strip():
+        raise CommandError('Файл JSON повреждён или обрезан!')
+
+
+READERS = {'.csv': read_csv, '.json': read_json}
+
+
+def parse(row):
+    if isinstance(row, dict):
+        row = [row.get('name'), row.get('measurement_unit')]
+    if not isinstance(row, list) or len(row) != 2:
+        return None
+    name, unit = (str(value or '').strip() for value in row)
+    if (not name or not unit or len(name) > MAX_LENGTH_200
+            or len(unit) > MAX_LENGTH_50):
+        return None
+    return name, unit
+
+
+def insert(rows):
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    values = ', '.join(['(%s, %s)'] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) VALUES {values} '
+            f'ON CONFLICT (name, measurement_unit) DO NOTHING RETURNING id',
+            [value for row in rows for value in row]
+        )
+        return len(cursor.fetchall())
 
 
 class Command(BaseCommand):
+    help = 'Загрузить ингредиенты из CSV или JSON без дублей'
 
-    def handle(self, *args, **kwargs):
-        file_path = os.path.join(os.path.dirname(__file__), 'ingredients.csv')
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH,
+                            help='Файл .csv или .json')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько строк вставлять за один запрос')
 
-        if not os.path.exists(file_path):
-            self.stdout.write(self.style.ERROR(f'Файл {file_path} не найден!'))
-            return
+    def handle(self, *args, **options):
+        path = options['path']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json!')
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден!')
 
-        with open(file_path, encoding='utf-8') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                name, unit = row
-                Ingredient.objects.get_or_create(name=name,
-                                                 measurement_unit=unit)
+        inserted = skipped = invalid = 0
+        seen = set()
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            rows = reader(file)
+            while chunk := list(islice(rows, options['batch_size'])):
+                batch = []
+                for row in chunk:
+                    row = parse(row)
+                    if row is None:
+                        invalid += 1
+                    elif row in seen:
+                        skipped += 1
+                    else:
+                        seen.add(row)
+                        batch.append(row)
+                if batch:
+                    added = insert(batch)
+                    inserted += added
+                    skipped += len(batch) - added
+            if inserted:
+                transaction.on_commit(lambda: bump_generation(GENERATION_KEY))
 
-        self.stdout.write(self.style.SUCCESS('Данные успешно загружены!'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено: {inserted}, уже были: {skipped}, '
+            f'с ошибками: {invalid}'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import TimelineEntry
+from recipes.timeline import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Заново заполнить ленты подписок'
+
+    def handle(self, *args, **options):
+        rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {TimelineEntry.objects.count()}'
+        ))
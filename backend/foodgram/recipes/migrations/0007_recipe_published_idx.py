@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-17 05:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_alter_favorite_options_alter_ingredient_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-published_date', '-id'], name='recipe_published_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.6 on 2026-10-17 06:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# SQL зафиксирован здесь: миграция не должна меняться вместе с
+# recipes.shopping_list.
+REBUILD = '''
+    INSERT INTO recipes_shoppinglistitem (user_id, ingredient_id, amount)
+    SELECT cart.user_id, item.ingredient_id, SUM(item.amount)
+    FROM recipes_shoppingcart AS cart
+    JOIN recipes_recipeingredient AS item ON item.recipe_id = cart.recipe_id
+    GROUP BY cart.user_id, item.ingredient_id
+'''
+
+
+def fill_shopping_lists(apps, schema_editor):
+    schema_editor.execute(REBUILD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'ordering': ['user', 'ingredient'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item')],
+            },
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-17 06:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeStats',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='Просмотры')),
+                ('short_link_hits', models.PositiveIntegerField(default=0, verbose_name='Переходы по короткой ссылке')),
+            ],
+        ),
+    ]
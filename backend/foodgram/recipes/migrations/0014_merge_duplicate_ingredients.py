@@ -0,0 +1,63 @@
+# Generated by Django 5.1.6 on 2026-10-17 06:48
+
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+# SQL зафиксирован здесь: миграция не должна меняться вместе с
+# recipes.shopping_list.
+REBUILD = '''
+    INSERT INTO recipes_shoppinglistitem (user_id, ingredient_id, amount)
+    SELECT cart.user_id, item.ingredient_id, SUM(item.amount)
+    FROM recipes_shoppingcart AS cart
+    JOIN recipes_recipeingredient AS item ON item.recipe_id = cart.recipe_id
+    GROUP BY cart.user_id, item.ingredient_id
+'''
+
+MAX_AMOUNT = 32_000
+
+
+def merge_duplicates(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    groups = Ingredient.objects.values('name', 'measurement_unit').annotate(
+        keep=Min('pk'), count=Count('pk')
+    ).filter(count__gt=1).order_by()
+    merged = False
+    for group in groups:
+        duplicates = Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(pk=group['keep'])
+        RecipeIngredient.objects.filter(ingredient__in=duplicates).update(
+            ingredient_id=group['keep']
+        )
+        # Рецепт мог ссылаться на несколько дублей: количества складываем,
+        # но не больше допустимого для поля, иначе smallint переполнится.
+        repeated = RecipeIngredient.objects.filter(
+            ingredient_id=group['keep']
+        ).values('recipe_id').annotate(
+            keep=Min('pk'), count=Count('pk'), amount=Sum('amount')
+        ).filter(count__gt=1).order_by()
+        for row in repeated:
+            RecipeIngredient.objects.filter(pk=row['keep']).update(
+                amount=min(row['amount'], MAX_AMOUNT)
+            )
+            RecipeIngredient.objects.filter(
+                recipe_id=row['recipe_id'], ingredient_id=group['keep']
+            ).exclude(pk=row['keep']).delete()
+        duplicates.delete()
+        merged = True
+    if merged:
+        ShoppingListItem.objects.all().delete()
+        schema_editor.execute(REBUILD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipestats'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
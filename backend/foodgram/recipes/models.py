@@ -1,10 +1,12 @@
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch, Value
+from django.db.models.functions import Coalesce
 
 from recipes.constants import (MAX_LENGTH_7, MAX_LENGTH_10,
                                MAX_LENGTH_50, MAX_LENGTH_200,
                                MIN_VALUE_VALIDATOR, MAX_VALUE_VALIDATOR)
-from users.models import User
+from users.models import User, is_subscribed_expression
 
 
 class Tag(models.Model):
@@ -42,11 +44,61 @@ class Ingredient(models.Model):
 
     class Meta:
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'measurement_unit'],
+                                    name='unique_ingredient'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        if user.is_anonymous:
+            return self.annotate(is_favorited=Value(False),
+                                 is_in_shopping_cart=Value(False))
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+
+    def with_counters(self):
+        return self.annotate(
+            views=Coalesce('stats__views', 0),
+            short_link_hits=Coalesce('stats__short_link_hits', 0),
+        )
+
+    def for_listing(self, user):
+        return self.with_user_flags(user).with_counters().annotate(
+            author_is_subscribed=is_subscribed_expression(user, 'author')
+        )
+
+    def for_fragments(self):
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch('recipe_ingredient',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient'
+                     )),
+        )
+
+    def for_read(self, user):
+        return self.with_user_flags(user).with_counters().select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            Prefetch('recipe_ingredient',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient'
+                     )),
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -64,6 +116,12 @@ class Recipe(models.Model):
         upload_to='media/',
         verbose_name='Картинка',
     )
+    image_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии картинки',
+    )
     text = models.TextField(
         verbose_name='Описание',
     )
@@ -92,13 +150,40 @@ class Recipe(models.Model):
     short_id = models.CharField(max_length=MAX_LENGTH_10, unique=True,
                                 blank=True, null=True)
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         ordering = ['-published_date']
+        indexes = [
+            models.Index(fields=['-published_date', '-id'],
+                         name='recipe_published_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeStats(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Рецепт',
+    )
+    views = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Просмотры',
+    )
+    short_link_hits = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Переходы по короткой ссылке',
+    )
+
+    def __str__(self):
+        return f'{self.recipe}: {self.views} просмотров'
+
+
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
         Recipe,
@@ -145,6 +230,10 @@ class Favorite(models.Model):
 
     class Meta:
         ordering = ['user', 'recipe']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_favorite'),
+        ]
 
     def __str__(self):
         return f'{self.user} добавил в избранное {self.recipe}'
@@ -166,6 +255,76 @@ class ShoppingCart(models.Model):
 
     class Meta:
         ordering = ['user', 'recipe']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_shopping_cart'),
+        ]
 
     def __str__(self):
         return f'{self.user} добавил в список покупок {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    amount = models.IntegerField(
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        ordering = ['user', 'ingredient']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_shopping_list_item'),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
+
+
+class TimelineEntry(models.Model):
+    subscriber = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    published_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        ordering = ['subscriber', '-published_date', '-recipe_id']
+        constraints = [
+            models.UniqueConstraint(fields=['subscriber', 'recipe'],
+                                    name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['subscriber', '-published_date', '-recipe'],
+                         name='timeline_feed_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.subscriber}'
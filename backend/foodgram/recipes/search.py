@@ -0,0 +1,84 @@
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+
+POSTGRES_UPDATE = f'''
+    UPDATE recipes_recipe AS recipe SET search_vector =
+        setweight(to_tsvector('{SEARCH_CONFIG}', recipe.name), 'A')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', recipe.text), 'B')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM recipes_recipeingredient AS item
+            JOIN recipes_ingredient AS ingredient
+                ON ingredient.id = item.ingredient_id
+            WHERE item.recipe_id = recipe.id
+        ), '')), 'C')
+'''
+
+SQLITE_INSERT = f'''
+    INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients)
+    SELECT recipe.id, recipe.name, recipe.text, coalesce((
+        SELECT group_concat(ingredient.name, ' ')
+        FROM recipes_recipeingredient AS item
+        JOIN recipes_ingredient AS ingredient
+            ON ingredient.id = item.ingredient_id
+        WHERE item.recipe_id = recipe.id
+    ), '')
+    FROM recipes_recipe AS recipe
+'''
+
+
+def update_search_index(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'{POSTGRES_UPDATE} WHERE recipe.id = ANY(%s)',
+                           [recipe_ids])
+        elif connection.vendor == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(recipe_ids))
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+                recipe_ids
+            )
+            cursor.execute(
+                f'{SQLITE_INSERT} WHERE recipe.id IN ({placeholders})',
+                recipe_ids
+            )
+
+
+def fts_query(query):
+    return ' '.join(
+        '"{}"*'.format(term.replace('"', '""')) for term in query.split()
+    )
+
+
+def search_recipes(queryset, query):
+    query = query.strip()
+    if not query:
+        return queryset
+    if connection.vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        return queryset.filter(RawSQL(
+            f'recipes_recipe.search_vector @@ {tsquery}', [query],
+            output_field=BooleanField()
+        )).annotate(search_rank=RawSQL(
+            f'ts_rank(recipes_recipe.search_vector, {tsquery})', [query],
+            output_field=FloatField()
+        )).order_by('-search_rank', '-published_date')
+    if connection.vendor == 'sqlite':
+        match = fts_query(query)
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [match]
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 5.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = recipes_recipe.id',
+            [match], output_field=FloatField()
+        )).order_by('-search_rank', '-published_date')
+    return queryset.filter(Q(name__icontains=query)
+                           | Q(text__icontains=query))
@@ -0,0 +1,127 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import connection
+
+ITEMS_TABLE = 'recipes_shoppinglistitem'
+
+UPSERT = (
+    'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+    f'SET amount = {ITEMS_TABLE}.amount + excluded.amount'
+)
+
+EXPECTED_ITEMS = '''
+    SELECT cart.user_id, item.ingredient_id, SUM(item.amount)
+    FROM recipes_shoppingcart AS cart
+    JOIN recipes_recipeingredient AS item ON item.recipe_id = cart.recipe_id
+    GROUP BY cart.user_id, item.ingredient_id
+'''
+
+REBUILD = f'''
+    INSERT INTO {ITEMS_TABLE} (user_id, ingredient_id, amount)
+    {EXPECTED_ITEMS}
+'''
+
+
+local = threading.local()
+
+
+def placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def lock_recipes(recipe_ids, share=False):
+    # Корзины и состав рецепта меняются по очереди: иначе при READ COMMITTED
+    # каждая сторона считает дельты, не видя незакоммиченных строк другой.
+    recipe_ids = sorted(set(recipe_ids))
+    if not recipe_ids or not connection.features.has_select_for_update:
+        return
+    mode = 'SHARE' if share else 'UPDATE'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT id FROM recipes_recipe '
+            f'WHERE id IN ({placeholders(recipe_ids)}) ORDER BY id '
+            f'FOR {mode}',
+            recipe_ids
+        )
+
+
+@contextmanager
+def manual_deltas():
+    # Внутри блока дельты применяет сам код, сигналы моделей их пропускают.
+    previous = getattr(local, 'manual', False)
+    local.manual = True
+    try:
+        yield
+    finally:
+        local.manual = previous
+
+
+def tracked_by_signals():
+    return not getattr(local, 'manual', False)
+
+
+def apply_cart_change(user_id, recipe_ids, sign):
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {ITEMS_TABLE} (user_id, ingredient_id, amount) '
+            f'SELECT %s, ingredient_id, %s * SUM(amount) '
+            f'FROM recipes_recipeingredient '
+            f'WHERE recipe_id IN ({placeholders(recipe_ids)}) '
+            f'GROUP BY ingredient_id {UPSERT}',
+            [user_id, sign, *recipe_ids]
+        )
+        if sign < 0:
+            cursor.execute(
+                f'DELETE FROM {ITEMS_TABLE} '
+                f'WHERE user_id = %s AND amount <= 0',
+                [user_id]
+            )
+
+
+def apply_recipe_change(recipe_id, deltas):
+    deltas = [(ingredient_id, delta)
+              for ingredient_id, delta in deltas.items() if delta]
+    if not deltas:
+        return
+    values = ' UNION ALL '.join(
+        ['SELECT %s AS ingredient_id, %s AS amount'] * len(deltas)
+    )
+    params = [value for delta in deltas for value in delta]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {ITEMS_TABLE} (user_id, ingredient_id, amount) '
+            f'SELECT cart.user_id, delta.ingredient_id, delta.amount '
+            f'FROM recipes_shoppingcart AS cart, ({values}) AS delta '
+            f'WHERE cart.recipe_id = %s {UPSERT}',
+            [*params, recipe_id]
+        )
+        cursor.execute(
+            f'DELETE FROM {ITEMS_TABLE} WHERE amount <= 0 AND user_id IN '
+            f'(SELECT user_id FROM recipes_shoppingcart WHERE recipe_id = %s)',
+            [recipe_id]
+        )
+
+
+def rebuild():
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {ITEMS_TABLE}')
+        cursor.execute(REBUILD)
+
+
+def expected_items():
+    with connection.cursor() as cursor:
+        cursor.execute(f'{EXPECTED_ITEMS} ORDER BY 1, 2')
+        yield from cursor
+
+
+def stored_items():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT user_id, ingredient_id, amount FROM {ITEMS_TABLE} '
+            f'ORDER BY 1, 2'
+        )
+        yield from cursor
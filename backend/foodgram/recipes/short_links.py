@@ -0,0 +1,76 @@
+from django.db.models import Q
+
+from recipes.constants import (SHORT_ID_ALPHABET, SHORT_ID_LENGTH,
+                               SHORT_ID_MULTIPLIER, SHORT_ID_OFFSET)
+from recipes.models import Recipe
+
+BASE = len(SHORT_ID_ALPHABET)
+SPACE = BASE ** SHORT_ID_LENGTH
+INVERSE = pow(SHORT_ID_MULTIPLIER, -1, SPACE)
+
+
+def to_digits(value, length=SHORT_ID_LENGTH):
+    digits = []
+    while value:
+        value, digit = divmod(value, BASE)
+        digits.append(digit)
+    return digits + [0] * (length - len(digits))
+
+
+def from_digits(digits):
+    value = 0
+    for digit in reversed(digits):
+        value = value * BASE + digit
+    return value
+
+
+def mix(value):
+    # Умножение разносит соседние ключи по всему пространству,
+    # разворот разрядов перемешивает младшие разряды со старшими.
+    value = (value * SHORT_ID_MULTIPLIER + SHORT_ID_OFFSET) % SPACE
+    value = from_digits(to_digits(value)[::-1])
+    return (value * SHORT_ID_MULTIPLIER + SHORT_ID_OFFSET) % SPACE
+
+
+def unmix(value):
+    value = (value - SHORT_ID_OFFSET) * INVERSE % SPACE
+    value = from_digits(to_digits(value)[::-1])
+    return (value - SHORT_ID_OFFSET) * INVERSE % SPACE
+
+
+def encode_short_id(pk):
+    # Первичный ключ переставляется внутри пространства идентификаторов,
+    # поэтому совпадений не бывает. Старые ссылки из shortuuid короче
+    # и с новыми не пересекаются.
+    high, low = divmod(pk, SPACE)
+    digits = to_digits(high * SPACE + mix(low))
+    return ''.join(SHORT_ID_ALPHABET[digit] for digit in reversed(digits))
+
+
+def decode_short_id(short_id):
+    if len(short_id) < SHORT_ID_LENGTH:
+        return None
+    digits = [SHORT_ID_ALPHABET.find(char) for char in reversed(short_id)]
+    if min(digits) < 0:
+        return None
+    high, low = divmod(from_digits(digits), SPACE)
+    return high * SPACE + unmix(low)
+
+
+def assign_short_id(recipe):
+    if recipe.short_id:
+        return
+    recipe.short_id = encode_short_id(recipe.pk)
+    Recipe.objects.filter(pk=recipe.pk).update(short_id=recipe.short_id)
+
+
+def find_recipe_id(short_id):
+    # Ссылку на рецепт, которому ещё не записали short_id,
+    # узнаём по первичному ключу, закодированному в ней самой.
+    lookup = Q(short_id=short_id)
+    pk = decode_short_id(short_id)
+    if pk and encode_short_id(pk) == short_id:
+        lookup |= Q(pk=pk, short_id__isnull=True)
+    return Recipe.objects.filter(lookup).values_list(
+        'pk', flat=True
+    ).first()
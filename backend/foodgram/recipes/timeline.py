@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.db import connection, transaction
+
+from jobs.queue import enqueue, task
+from recipes.models import Recipe, TimelineEntry
+from users.models import Subscription
+
+FAN_OUT_TASK = 'timeline.fan_out'
+
+
+def fan_out_batch(recipe, after=0):
+    # Граница пачки ищется по индексу подписок, а строки ленты
+    # копируются одним INSERT ... SELECT без выборки в Python.
+    boundary = list(Subscription.objects.filter(
+        author_id=recipe.author_id, pk__gt=after
+    ).order_by('pk').values_list('pk', flat=True)[
+        settings.FEED_FAN_OUT_BATCH_SIZE - 1:settings.FEED_FAN_OUT_BATCH_SIZE
+    ])
+    last = boundary[0] if boundary else None
+    quote = connection.ops.quote_name
+    timeline = quote(TimelineEntry._meta.db_table)
+    subscriptions = quote(Subscription._meta.db_table)
+    params = [recipe.pk, recipe.author_id,
+              connection.ops.adapt_datetimefield_value(recipe.published_date),
+              recipe.author_id, after]
+    bound = ''
+    if last is not None:
+        bound = 'AND id <= %s'
+        params.append(last)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {timeline} '
+            f'(subscriber_id, recipe_id, author_id, published_date) '
+            f'SELECT subscriber_id, %s, %s, %s FROM {subscriptions} '
+            f'WHERE author_id = %s AND id > %s {bound} '
+            f'ON CONFLICT (subscriber_id, recipe_id) DO NOTHING',
+            params
+        )
+    return last
+
+
+def fan_out(recipe):
+    # Первую пачку подписчиков получают сразу, остальных
+    # у популярных авторов раскладывает воркер.
+    if recipe.author_id is None:
+        return
+    last = fan_out_batch(recipe)
+    if last is not None:
+        enqueue(FAN_OUT_TASK, recipe=recipe.pk, after=last)
+
+
+@task(FAN_OUT_TASK)
+def continue_fan_out(recipe, after):
+    recipe = Recipe.objects.only(
+        'author_id', 'published_date'
+    ).filter(pk=recipe).first()
+    while recipe is not None and after is not None:
+        # Каждая пачка коммитится отдельно, повтор задачи безопасен.
+        with transaction.atomic():
+            after = fan_out_batch(recipe, after)
+
+
+def backfill(subscriber_id, author_ids):
+    for author_id in author_ids:
+        recipes = Recipe.objects.filter(author_id=author_id).order_by(
+            '-published_date', '-id'
+        ).values_list('pk', 'published_date')[:settings.FEED_BACKFILL_SIZE]
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(subscriber_id=subscriber_id, recipe_id=recipe_id,
+                          author_id=author_id, published_date=published_date)
+            for recipe_id, published_date in recipes
+        ], ignore_conflicts=True)
+
+
+def trim(subscriber_id, author_ids):
+    TimelineEntry.objects.filter(
+        subscriber_id=subscriber_id, author_id__in=author_ids
+    ).delete()
+
+
+def rebuild():
+    with transaction.atomic():
+        TimelineEntry.objects.all().delete()
+        subscriptions = Subscription.objects.order_by(
+            'subscriber_id'
+        ).values_list('subscriber_id', 'author_id')
+        for subscriber_id, author_id in subscriptions.iterator():
+            backfill(subscriber_id, [author_id])
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-17 05:56
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    Subscription = apps.get_model('users', 'Subscription')
+    duplicates = Subscription.objects.values('subscriber', 'author').annotate(
+        keep_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for duplicate in duplicates:
+        Subscription.objects.filter(
+            subscriber=duplicate['subscriber'], author=duplicate['author']
+        ).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_avatar'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(fields=('subscriber', 'author'), name='unique_subscription'),
+        ),
+    ]
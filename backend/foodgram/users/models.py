@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Exists, OuterRef, Value
 
 from users.validators import validate_username
 
@@ -29,6 +30,12 @@ class User(AbstractUser):
         verbose_name='Пароль',
     )
     avatar = models.ImageField(upload_to='users/', null=True, blank=True)
+    avatar_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии аватара',
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
@@ -49,5 +56,19 @@ class Subscription(models.Model):
         verbose_name="Автор",
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['subscriber', 'author'],
+                                    name='unique_subscription'),
+        ]
+
     def __str__(self):
         return f'{self.subscriber} подписан на: {self.author}'
+
+
+def is_subscribed_expression(user, author_field='pk'):
+    if user.is_anonymous:
+        return Value(False)
+    return Exists(Subscription.objects.filter(
+        subscriber=user, author=OuterRef(author_field)
+    ))